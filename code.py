@@ -1,7 +1,7 @@
 
 '''
 This code implements algorithm based on https://academic.oup.com/bioinformatics/article/20/11/1710/300143
-User can choose the minimal temperature and maximpal temperature in Celsius degrees for the primers in the code: class PrimerDesignGA
+User can choose the minimal temperature and maximpal temperature in Celsius degrees for the primers in the code: class PrimerScorer
 Before using the code,one can specify in driver.py what other parameters will be used throughout the optimization
 Authors: Olga Wieromiejczyk, Anna Krzywiecka
 
@@ -10,6 +10,67 @@ import random
 import subprocess
 import os
 import argparse
+import bisect
+import cProfile
+import csv
+import hashlib
+import heapq
+import json
+import mmap
+import pickle
+import pstats
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def complementary(sequence):
+    """Return the complementary sequence."""
+    compl_sequence = ''
+    dic = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
+    for i in sequence:
+        compl_sequence += dic[i]
+    compl_sequence = compl_sequence[::-1]
+    return compl_sequence
+
+
+def complementarity_check(seq1, seq2):
+    """Check if two sequences are complementary and would hybridize."""
+    
+    # Deciding how many TA pairs and how many CG pairs will result in a secondary structure
+    how_many_TA = 6
+    how_many_CG = 4
+    summary_how_many = (how_many_TA + how_many_CG) / 2
+    
+    # Artificial change for comparing sequences
+    seq2 = complementary(seq2)
+
+    if len(seq1) > len(seq2):
+        longer, shorter = seq1, seq2
+    else:
+        longer, shorter = seq2, seq1
+
+    for i in range(len(longer)):
+        counter_TA, counter_CG = 0, 0
+        for j in range(len(shorter)):
+            if i + j >= len(longer):
+                break
+            if longer[i + j] == shorter[j] and longer[i + j] in ('A', 'T'):
+                counter_TA += 1
+            elif longer[i + j] == shorter[j] and longer[i + j] in ('G', 'C'):
+                counter_CG += 1
+        if len(longer) - i - 1 < min(how_many_TA, how_many_CG):
+            break
+        
+        # Normalization
+        counter_CG = counter_CG * how_many_TA / how_many_CG
+        counter_TA = counter_TA * how_many_CG / how_many_TA
+        if counter_CG + counter_TA >= summary_how_many:
+            return True
+    return False
+
 
 # Basic class representing a pair of primers
 class PrimerPair:
@@ -25,25 +86,819 @@ class PrimerPair:
         self.GC = None
         self.Tmd = None
         self.uni = 0
+        self.confirmed = False # uni was counted from whole-genome BLAST hits, not only from the regional screen
         self.lengd = None
         self.leng = None
         self.PC = None
         self.Term = None
         self.Sc = None
+        self.origin = None # Operator which created the pair: 'crossover' or 'mutation'
 
     def __str__(self):
-        return (f'Fs = {self.fs}, alpha = {self.alpha}, beta = {self.beta}, gamma = {self.gamma}, '
-                f'GC = {self.GC}, Tmd = {self.Tmd}, uni = {self.uni}, lengd = {self.lengd}, '
-                f'leng = {self.leng}, PC = {self.PC}, Term = {self.Term}, Sc = {self.Sc}')
+        return ', '.join(f'{name} = {value}' for name, value in self.as_dict().items())
+
+    def as_dict(self):
+        """Return the coordinates and properties of the pair, in the order they are printed."""
+        return {'Fs': self.fs, 'alpha': self.alpha, 'beta': self.beta, 'gamma': self.gamma,
+                'GC': self.GC, 'Tmd': self.Tmd, 'uni': self.uni, 'lengd': self.lengd,
+                'leng': self.leng, 'PC': self.PC, 'Term': self.Term, 'Sc': self.Sc}
+
+    # Fitness of a pair with no penalty at all, which 1 / penalty cannot give. It is higher than the fitness
+    # of any pair with a penalty, the lowest nonzero penalty being 3 * 0.25 of lengd, and finite, so that
+    # the roulette, the run log statistics and the results files work as for any other pair
+    PERFECT_FITNESS = 2.0
+
+    def penalty(self, uni):
+        """Return the weighted sum of the penalties of the pair, with the given uni."""
+        return (self.leng + 3 * self.lengd + 3 * self.Tmd + 3 * self.GC + 3 * self.Term +
+                50 * uni + 10 * self.Sc + 10 * self.PC)
+
+    @classmethod
+    def fitness_of(cls, penalty):
+        """Return the fitness of a pair with the given penalty."""
+        return 1 / penalty if penalty > 0 else cls.PERFECT_FITNESS
 
     def FITNESS_counting(self):
         """Calculate fitness score based on primer properties."""
-        self.fitness = 1 / (self.leng + 3 * self.lengd + 3 * self.Tmd + 3 * self.GC + 3 * self.Term +
-                            50 * self.uni + 10 * self.Sc + 10 * self.PC)
+        self.fitness = self.fitness_of(self.penalty(self.uni))
+
+    def fitness_bound(self):
+        """Return the highest fitness the pair can reach after BLAST, i.e. its fitness with uni = 0."""
+        return self.fitness_of(self.penalty(0))
+
+# Random numbers of a run
+class RandomStream(random.Random):
+    """Seeded random number generator of one GA, which can spawn independent child streams.
+
+    The root stream of a seed gives the same numbers as random.seed(seed). A child stream is
+    seeded from the seed and the key of its parent and its own number, so that a worker, island
+    or batch gets the same numbers whatever process it runs in and whenever it is spawned.
+    """
+    def __init__(self, seed=None, key=()):
+        if seed is None: # A seed is drawn, so that the run can still be repeated from its metadata
+            seed = random.SystemRandom().randrange(2 ** 63)
+        self.seed_value = seed
+        self.key = tuple(key) # Numbers of the spawned streams leading from the root stream to this one
+        self.spawned = 0 # Number of child streams spawned so far
+        super().__init__(seed if not self.key else self.derive(seed, self.key))
+
+    @staticmethod
+    def derive(seed, key):
+        """Return the seed of the child stream with the given key."""
+        digest = hashlib.sha256(repr((seed,) + tuple(key)).encode()).digest()
+        return int.from_bytes(digest[:16], 'big')
+
+    def spawn(self, number=1):
+        """Return the given number of new independent child streams."""
+        streams = [RandomStream(self.seed_value, self.key + (self.spawned + index,)) for index in range(number)]
+        self.spawned += number
+        return streams
+
+# Per-generation log of the run
+class RunLog:
+    """Buffered log with one row per generation, written as CSV or JSON lines.
+
+    Rows are kept in memory and written every `flush_every` generations.
+    If `compat_file` is given, the best fitness of every row is also appended
+    to it in the old one-value-per-line format read by the R plotting scripts.
+    """
+    FIELDS = ['generation', 'best_fitness', 'mean_fitness', 'median_fitness', 'diversity',
+              'new_offspring', 'attempts', 'rejected', 'rejection_rate', 'pruned',
+              'Pe', 'Pm', 'crossover_success', 'mutation_success', 'refined', 'blast_queries', 'cache_hits', 'kmer_skipped',
+              'regional_queries', 'confirmed', 'breed_time', 'blast_time', 'sort_time']
+
+    def __init__(self, file_name, fmt='csv', flush_every=10, compat_file=None, offsets=None):
+        if fmt not in ('csv', 'jsonl'):
+            raise ValueError(f"Unknown run log format: {fmt}")
+        self.file_name = file_name
+        self.fmt = fmt
+        self.flush_every = max(1, flush_every)
+        self.compat_file = compat_file
+        self.rows = [] # Rows waiting to be written
+        self.compat_rows = [] # Best fitness values waiting to be written to the compatibility file
+        if offsets is None or not os.path.exists(self.file_name):
+            with open(self.file_name, 'w', newline='') as file:
+                if self.fmt == 'csv':
+                    csv.writer(file).writerow(self.FIELDS)
+        if offsets is not None: # Resumed run: drop the rows written after the checkpoint from the files of this run
+            for role, name in (('log', self.file_name), ('compat', self.compat_file)):
+                if name is not None and role in offsets and os.path.exists(name) and os.path.getsize(name) > offsets[role]:
+                    with open(name, 'r+') as file:
+                        file.truncate(offsets[role])
+
+    def record(self, row, compat=True):
+        """Add one generation to the log, writing the buffer out if it is full."""
+        self.rows.append(row)
+        if compat and self.compat_file is not None:
+            self.compat_rows.append(row['best_fitness'])
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows to the log files."""
+        if self.rows:
+            with open(self.file_name, 'a', newline='') as file:
+                if self.fmt == 'csv':
+                    writer = csv.DictWriter(file, fieldnames=self.FIELDS)
+                    writer.writerows(self.rows)
+                else:
+                    for row in self.rows:
+                        file.write(json.dumps(row) + "\n")
+            self.rows.clear()
+        if self.compat_rows:
+            with open(self.compat_file, 'a') as file:
+                for fitness in self.compat_rows:
+                    file.write(f"{fitness}\n")
+            self.compat_rows.clear()
+
+    def close(self):
+        self.flush()
+
+    def offsets(self):
+        """Write buffered rows and return the current size of the log files, by their role: 'log' or 'compat'."""
+        self.flush()
+        offsets = {}
+        for role, name in (('log', self.file_name), ('compat', self.compat_file)):
+            if name is not None:
+                offsets[role] = os.path.getsize(name) if os.path.exists(name) else 0
+        return offsets
+
+# Best results of a run
+class TopPairs:
+    """Best distinct primer pairs seen during a run, written to a results file whenever they change.
+
+    The file is written as TSV, with the sequences, coordinates and score breakdown of every pair,
+    or as FASTA with PrimerDesignGA.write_primers_to_fasta. It is written to a temporary file and
+    renamed, so a reader always finds the complete provisional results of the run.
+    """
+    def __init__(self, file_name, k=10, fmt='tsv'):
+        if fmt not in ('tsv', 'fasta'):
+            raise ValueError(f"Unknown results format: {fmt}")
+        self.file_name = file_name
+        self.k = k
+        self.fmt = fmt
+        self.rows = {} # {(fs, alpha, beta, gamma): row of the results file}
+
+    def update(self, scorer, population, generation):
+        """Add the best pairs of a sorted population scored by the given PrimerScorer, writing the file if the top pairs changed."""
+        changed = False
+        for pair in population[:self.k]:
+            if not pair.confirmed: # Only pairs with whole-genome uni are reported
+                continue
+            key = (pair.fs, pair.alpha, pair.beta, pair.gamma)
+            if key in self.rows:
+                continue
+            if len(self.rows) >= self.k and pair.fitness <= min(row['fitness'] for row in self.rows.values()):
+                break # The population is sorted, the next pairs are not better
+            forward, reverse = scorer.primer_sequences(pair)
+            row = {'forward': forward, 'reverse': complementary(reverse)}
+            row.update(pair.as_dict())
+            row.update({'fitness': pair.fitness, 'generation': generation})
+            self.rows[key] = row
+            changed = True
+        if changed:
+            best = sorted(self.rows.items(), key=lambda item: item[1]['fitness'], reverse=True)[:self.k]
+            self.rows = dict(best)
+            self.write(scorer)
 
+    def write(self, scorer):
+        """Replace the results file with the current top pairs."""
+        temp_file = self.file_name + ".tmp"
+        if self.fmt == 'fasta':
+            PrimerDesignGA.write_primers_to_fasta(scorer.dna_sequence, [PrimerPair(*key) for key in self.rows], temp_file)
+        else:
+            with open(temp_file, 'w', newline='') as file:
+                writer = None
+                for rank, row in enumerate(self.rows.values()):
+                    if writer is None:
+                        writer = csv.DictWriter(file, fieldnames=['rank'] + list(row), delimiter='\t')
+                        writer.writeheader()
+                    writer.writerow({'rank': rank, **row})
+        os.replace(temp_file, self.file_name)
+
+# Profiling of a run
+class RunProfiler:
+    """Profile a run with cProfile, a sampler of the call stack and optionally tracemalloc.
+
+    Files written by stop():
+    <prefix>.prof - cProfile statistics, readable with pstats or snakeviz
+    <prefix>.collapsed - sampled call stacks in the collapsed format of flamegraph.pl, speedscope and inferno
+    <prefix>_memory.txt - top allocation sites at every generation, only with memory=True
+    Both cProfile and the sampler measure wall time, so the time spent waiting for blastn
+    is counted in blast_search, called from specifity in the phase which started the search.
+    """
+    def __init__(self, prefix, memory=False, interval=0.005, top=15):
+        self.prefix = prefix
+        self.memory = memory # Take tracemalloc snapshots at generation boundaries
+        self.interval = interval # Seconds between samples of the call stack
+        self.top = top # Number of allocation sites in the memory report
+        self.profile = cProfile.Profile()
+        self.stacks = {} # {collapsed stack: number of samples}
+        self.memory_report = []
+        self.previous_snapshot = None
+        self.running = False
+        self.paused = False # Set while the profiler takes its own snapshots, which should not be profiled
+
+    def start(self):
+        """Start profiling the calling thread."""
+        self.running = True
+        self.thread_id = threading.get_ident()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        if self.memory:
+            tracemalloc.start()
+        self.profile.enable()
+
+    def sample(self):
+        """Count the call stacks of the profiled thread until the profiling stops."""
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack and not self.paused:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def generation(self, number):
+        """Record the allocation sites at the start of a generation."""
+        if not self.memory:
+            return
+        self.paused = True
+        self.profile.disable()
+        # The snapshots kept by the profiler are allocated in tracemalloc itself, they are not a part of the run
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory_report.append(f"Generation {number}: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB")
+        if self.previous_snapshot is None:
+            stats = snapshot.statistics('lineno')
+        else:
+            stats = snapshot.compare_to(self.previous_snapshot, 'lineno')
+        self.memory_report.extend(f"    {stat}" for stat in stats[:self.top])
+        self.previous_snapshot = snapshot
+        self.profile.enable()
+        self.paused = False
+
+    def stop(self):
+        """Stop profiling and write the reports."""
+        if self.memory:
+            self.generation('end')
+            tracemalloc.stop()
+        self.profile.disable()
+        self.running = False
+        self.sampler.join()
+        self.profile.dump_stats(f"{self.prefix}.prof")
+        with open(f"{self.prefix}.collapsed", 'w') as file:
+            for stack, count in self.stacks.items():
+                file.write(f"{stack} {count}\n")
+        if self.memory:
+            with open(f"{self.prefix}_memory.txt", 'w') as file:
+                file.write("\n".join(self.memory_report) + "\n")
+        pstats.Stats(self.profile).sort_stats('cumulative').print_stats(20)
+
+# Occurrences of short sequences in the genome
+class KmerTable:
+    """Memory-mapped number of occurrences of every k-mer in the reference genome, built with kmer_table.py.
+
+    The file holds 4**k unsigned 32-bit counts of one genome strand, indexed by the k-mer
+    written in base 4 (A = 0, C = 1, G = 2, T = 3). count() adds the reverse complement,
+    so that both strands are counted, like in BLAST.
+    """
+    CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.counts = memoryview(self.map).cast('I')
+        self.k = 0
+        while 4 ** self.k < len(self.counts):
+            self.k += 1
+        if 4 ** self.k != len(self.counts):
+            raise ValueError(f"{file_name} is not a k-mer table: its size is not 4**k counts")
+
+    @classmethod
+    def index(cls, kmer):
+        """Return the position of a k-mer in the table, or None if it has other bases than A, C, G and T."""
+        index = 0
+        for base in kmer:
+            code = cls.CODES.get(base)
+            if code is None:
+                return None
+            index = index * 4 + code
+        return index
+
+    def count(self, kmer):
+        """Return the number of occurrences of a k-mer on both strands of the genome."""
+        total = 0
+        for strand in (kmer, complementary(kmer)):
+            index = self.index(strand)
+            if index is not None:
+                total += self.counts[index]
+        return total
+
+# Approximate matches of primers in a region of the genome
+class RegionIndex:
+    """In-memory index of a small region of the genome around the target, used for the regional screen of primers.
+
+    A primer matches where it aligns without gaps with at most 10% mismatches, like with the
+    -perc_identity 90 of the BLAST search, on either strand. Candidate positions are found through
+    k-mer seeds: with m mismatches, one of m + 1 pieces of the primer matches exactly.
+
+    The counts are a heuristic, not the ones of blastn-short: BLAST finds gapped and partial matches
+    which the index misses, and misses matches without an exact 7-mer seed which the index finds.
+    The index takes about 45 MB and 0.014 s per primer for every Mb of the region, so it is meant
+    for regions of a few Mb, not whole chromosomes; use a BLAST database of the region for those.
+    """
+    k = 6 # Short enough for the pieces of an 18 to 30 bases long primer
+
+    def __init__(self, sequence):
+        self.sequence = sequence.upper()
+        self.positions = {} # {k-mer: positions in the region}
+        for position in range(len(self.sequence) - self.k + 1):
+            self.positions.setdefault(self.sequence[position:position + self.k], []).append(position)
+
+    def matches(self, primer):
+        """Return the start positions of the matches of a primer on the forward strand of the region."""
+        mismatches = len(primer) // 10
+        piece = max(self.k, len(primer) // (mismatches + 1))
+        found = set()
+        for offset in range(0, len(primer) - piece + 1, piece):
+            for position in self.positions.get(primer[offset:offset + self.k], ()):
+                start = position - offset
+                if start < 0 or start in found:
+                    continue
+                window = self.sequence[start:start + len(primer)]
+                if len(window) == len(primer) and sum(a != b for a, b in zip(primer, window)) <= mismatches:
+                    found.add(start)
+        return found
+
+    def count(self, primer):
+        """Return the number of matches of a primer on both strands of the region."""
+        return len(self.matches(primer)) + len(self.matches(complementary(primer)))
+
+# Single-primer properties of one candidate primer
+class PrimerCandidate:
+    def __init__(self, seq):
+        self.seq = seq # Sequence of the primer 5' -> 3'
+        gc = seq.count('G') + seq.count('C')
+        at = seq.count('A') + seq.count('T')
+        self.gc_ok = len(seq) > 0 and 0.4 <= gc / len(seq) <= 0.6 # GC content between 40 and 60%
+        # Melting temperature, see properties() for the formula
+        self.tm = gc * 4 + at * 2 if len(seq) <= 13 else 64.9 + 41 * (gc - 16.4) / len(seq)
+        # The primer should end with a G or a C, but not with three of them
+        if len(seq) >= 1 and seq[-1] in ('G', 'C'):
+            self.term = 1 if len(seq) >= 3 and seq[-2] in ('G', 'C') and seq[-3] in ('G', 'C') else 0
+        else:
+            self.term = 1
+        self.sc = None # Hairpin or self-dimer, computed on first use
+
+    def self_complementary(self):
+        """Check whether the primer forms a hairpin or a linear self-dimer."""
+        if self.sc is None:
+            min_loop_size = 3
+            min_stem_size = 4
+            seq = self.seq
+            self.sc = False
+            if len(seq) - 2 * min_stem_size - min_loop_size >= 0:
+                for i in range(len(seq) - min_loop_size - 2 * min_stem_size + 1):
+                    if complementarity_check(seq[:min_stem_size + i], seq[min_stem_size + i + min_loop_size:]):
+                        self.sc = True
+                        break
+            if not self.sc:
+                self.sc = complementarity_check(seq, seq)
+        return self.sc
+
+# Table of all candidate primers of a sequence
+class PrimerTable:
+    """Single-primer properties of every candidate forward and reverse primer, built once per sequence.
+
+    Forward primers are indexed by (fs, alpha) and reverse primers by (rs, gamma), where rs is the
+    start of the reverse primer in the sequence (rs = fs + alpha + beta). Primers meeting the GC
+    and melting temperature limits are feasible and new primer pairs are drawn from them.
+    """
+    def __init__(self, dna_sequence, beg_true, end_true, mintemp, maxtemp):
+        self.dna_sequence = dna_sequence
+        lengths = range(min_primer_length, max_primer_length + 1)
+        self.forward = {} # {(fs, alpha): PrimerCandidate}
+        for fs in range(0, beg_true + 1):
+            for alpha in lengths:
+                seq = dna_sequence[fs:fs + alpha]
+                if len(seq) == alpha and self.is_dna(seq):
+                    self.forward[(fs, alpha)] = PrimerCandidate(seq)
+        self.reverse = {} # {(rs, gamma): PrimerCandidate}
+        for rs in range(end_true, len(dna_sequence) - min_primer_length + 1):
+            for gamma in lengths:
+                preseq = dna_sequence[rs:rs + gamma]
+                if len(preseq) == gamma and self.is_dna(preseq):
+                    self.reverse[(rs, gamma)] = PrimerCandidate(complementary(preseq))
+
+        self.feasible_forward = self.feasible(self.forward, mintemp, maxtemp) # Keys of feasible forward primers
+        self.feasible_reverse = self.feasible(self.reverse, mintemp, maxtemp) # Keys of feasible reverse primers
+        self.forward_set = set(self.feasible_forward)
+        self.reverse_set = set(self.feasible_reverse)
+        self.forward_starts = {} # {alpha: [fs of feasible forward primers]}
+        for fs, alpha in self.feasible_forward:
+            self.forward_starts.setdefault(alpha, []).append(fs)
+        self.reverse_starts = {} # {gamma: [rs of feasible reverse primers]}
+        for rs, gamma in self.feasible_reverse:
+            self.reverse_starts.setdefault(gamma, []).append(rs)
+
+    @staticmethod
+    def is_dna(seq):
+        return all(base in 'ACGT' for base in seq)
+
+    @staticmethod
+    def feasible(rows, mintemp, maxtemp):
+        """Return the keys of primers meeting the GC and melting temperature limits, or of all primers if none does."""
+        keys = [key for key, primer in rows.items() if primer.gc_ok and mintemp <= primer.tm <= maxtemp]
+        if not keys:
+            print('WARNING: No primer meets the GC and melting temperature limits, all primers are used')
+            keys = list(rows)
+        return keys
+
+    def forward_primer(self, fs, alpha):
+        """Return the forward primer starting at fs, computing it if it is not in the table."""
+        primer = self.forward.get((fs, alpha))
+        if primer is None:
+            primer = PrimerCandidate(str(self.dna_sequence[fs:fs + alpha]))
+        return primer
+
+    def reverse_primer(self, rs, gamma):
+        """Return the reverse primer starting at rs, computing it if it is not in the table."""
+        primer = self.reverse.get((rs, gamma))
+        if primer is None:
+            primer = PrimerCandidate(complementary(str(self.dna_sequence[rs:rs + gamma])))
+        return primer
+
+# Scoring of primer pairs
+class PrimerScorer:
+    """Properties, specificity and fitness of primer pairs of one sequence, without running the GA.
+
+    Holds what scoring needs: the primer table, the BLAST hit counts, the k-mer table and the
+    regional screen. PrimerDesignGA scores its pairs with one, and score.py, multiplex.py and
+    --exact use one directly.
+    """
+    def __init__(self, dna_sequence, beg_true, end_true, hit_counts=None, primer_table=None,
+                 kmer_table=None, kmer_threshold=1000, blast_db="human_genome_db",
+                 regional_index=None, regional_db=None, verbose=True):
+        self.dna_sequence = dna_sequence  # Sequence in which the pair of primers should be found
+        self.beg_true = beg_true  # Start of the target sequence
+        self.end_true = end_true  # End of the target sequence
+        self.maxtemp = 70 # Maximal melting temperature
+        self.mintemp = 50 # Minimal melting temperature
+        self.verbose = verbose # Print a summary of the exhaustive search
+        self.stats = self.new_stats() # Counters and timings of the searches, logged and reset by the GA using the scorer
+        # Number of BLAST hits of every primer searched so far, it can be shared between runs on the same database
+        self.hit_counts = hit_counts if hit_counts is not None else {}
+        self.blast_db = blast_db # BLAST database of the genome
+        self.kmer_table = kmer_table # KmerTable used to skip BLAST for primers with a too common 3' end, None turns it off
+        self.kmer_threshold = kmer_threshold # Maximal number of occurrences of the 3' k-mer of a primer searched with BLAST
+        # Tiered specificity: new pairs are screened against a region of the genome only, with a RegionIndex
+        # or a BLAST database of the region, and only the elite pairs are checked against the whole genome
+        if regional_index is not None and dna_sequence.upper() not in regional_index.sequence:
+            # Otherwise a primer's own site is not in the region and its regional count is 0
+            raise ValueError("The region of the regional screen must contain the DNA sequence")
+        self.regional_index = regional_index
+        self.regional_db = regional_db
+        self.tiered = regional_index is not None or regional_db is not None
+        self.regional_counts = {} # Number of regional hits of every primer screened so far
+        if primer_table is None: # Candidate primers, it can be shared between runs on the same sequence
+            primer_table = PrimerTable(dna_sequence, beg_true, end_true, self.mintemp, self.maxtemp)
+        self.primer_table = primer_table
+
+    @staticmethod
+    def new_stats():
+        """Return zeroed counters and timings of the searches."""
+        return {'blast_queries': 0, 'cache_hits': 0, 'kmer_skipped': 0, 'regional_queries': 0, 'blast_time': 0.0}
+
+    def properties(self, pair):
+        """Calculate properties of a primer pair to obtain its fitness score.
+
+        Properties of single primers are taken from the primer table, only the ones
+        of the pair are calculated here.
+        """
+        forward = self.primer_table.forward_primer(pair.fs, pair.alpha)
+        # The reverse primer is stored as the complementary and reversed sequence, this way it is written 5'-> 3'
+        reverse = self.primer_table.reverse_primer(pair.rs, pair.gamma)
+        seqF, seqR = forward.seq, reverse.seq
+
+        # The GC content should be between 40 and 60%
+        pair.GC = 0 if forward.gc_ok and reverse.gc_ok else 1
+
+        # Counting the melting temperature difference beatween primers in pair
+        # On the basis of https://www.rosalind.bio/en/knowledge/what-formula-is-used-to-calculate-tm 
+        # It should be less than 5 Celsius degrees and be between the minimal and maximal temperature specified in the code by user (default: 50, 70)
+        pair.Tmd = 0 if self.temperatures_match(forward.tm, reverse.tm) else 1
+        
+        # Checking the termination which should ba a G or a C for both primers. It can consist of two Gs or Cs but not more
+        pair.Term = forward.term + reverse.term
+
+        pair.lengd = self.length_difference(len(seqF), len(seqR))
+        # Analyzing the length of primers. They should be between minimal and maximal primer length, default(18,30)
+        pair.leng = 0 if min_primer_length <= len(seqF) <= max_primer_length and min_primer_length <= len(seqR) <= max_primer_length else 1
+
+        # Checking the self-complementarity: hairpins and linear complementarity
+        pair.Sc = 1 if forward.self_complementary() or reverse.self_complementary() else 0
+            
+        # Checking whether two primers hybrydize together. The minimal number of compatible nucleotides can be changed in function complementarity_check(how_manyTA, how_manyCG)
+        pair.PC = 1 if complementarity_check(seqF, seqR) else 0
+
+    def temperatures_match(self, FTM, RTM):
+        """Check that the melting temperatures of two primers differ by at most 5 degrees and are within the limits."""
+        return abs(FTM - RTM) <= 5 and self.mintemp <= FTM <= self.maxtemp and self.mintemp <= RTM <= self.maxtemp
+
+    @staticmethod
+    def length_difference(alpha, gamma):
+        """Return the lengd penalty of primers of the given lengths."""
+        # Counting the length difference betaween primers in pair, it is a scale, but cannot be more than 5nn different
+        if abs(alpha - gamma) == 5:
+            return 0.75
+        elif 3 <= abs(alpha - gamma) < 5:
+            return 0.5
+        elif 0 < abs(alpha - gamma) < 3:
+            return 0.25
+        elif abs(alpha - gamma) == 0:
+            return 0
+        else:
+            return 1
+
+    def primer_sequences(self, pair):
+        """Return the forward and the reverse primer of a pair as they are searched with BLAST."""
+        return self.dna_sequence[pair.fs:pair.fe], self.dna_sequence[pair.rs:pair.re]
+
+    def seed_count(self, primer, is_reverse):
+        """Return the number of occurrences of the 3' end of a primer in the genome, counted with the k-mer table."""
+        k = self.kmer_table.k
+        # The reverse primer is taken as written in the genome, its 3' end is the complement of the first bases
+        return self.kmer_table.count(primer[:k] if is_reverse else primer[-k:])
+
+    def check_specificity(self, pairs):
+        """Check the specificity of the given primer pairs and count their fitness.
+
+        Every distinct primer is searched with BLAST only once per run. The number of hits
+        is kept in self.hit_counts and mapped back to the pairs by sequence.
+        With a k-mer table, primers whose 3' end is too common are not searched at all and
+        the number of occurrences of the 3' end is used as their number of hits.
+        """
+        if not pairs:
+            return
+        start = time.perf_counter()
+        queries = {} # Primers without a known number of hits, {sequence: name}
+        hits = {} # Hits of the primers of these pairs, kept here in case a shared hit_counts drops them meanwhile
+        skipped = 0
+        for pair in pairs:
+            for is_reverse, primer in enumerate(self.primer_sequences(pair)):
+                if primer in hits or primer in queries:
+                    continue
+                known = self.hit_counts.get(primer)
+                if known is not None:
+                    hits[primer] = known
+                    continue
+                seeds = self.seed_count(primer, is_reverse) if self.kmer_table is not None else 0
+                if seeds > self.kmer_threshold:
+                    hits[primer] = self.hit_counts[primer] = seeds
+                    skipped += 1
+                else:
+                    queries[primer] = f"q{len(queries)}"
+
+        if queries:
+            try:
+                results = self.blast_search(queries, self.blast_db)
+            except RuntimeError as e:
+                raise RuntimeError(f"Specificity of the primers could not be checked with BLASTN: {e}") from e
+            for primer, name in queries.items():
+                hits[primer] = self.hit_counts[primer] = results.get(name, 0) # Primers without any hit are missing in BLAST output
+        self.stats['blast_queries'] += len(queries)
+        self.stats['kmer_skipped'] += skipped
+        self.stats['cache_hits'] += 2 * len(pairs) - len(queries) - skipped
+
+        for pair in pairs:
+            pair.uni = 0
+            for primer in self.primer_sequences(pair):
+                if hits[primer] != 1: # A primer should bind exactly one place in the genome
+                    pair.uni += 1
+            pair.confirmed = True
+            pair.FITNESS_counting()
+        self.stats['blast_time'] += time.perf_counter() - start
+
+    def check_regional_specificity(self, pairs):
+        """Count the fitness of the given primer pairs from their hits in the region of the genome only.
+
+        With a regional BLAST database which contains the DNA sequence, a primer can only have more
+        hits in the whole genome than in the region, so the fitness is an upper bound. The counts of a
+        RegionIndex are a heuristic, with no such bound. Either way the fitness is corrected by
+        confirm_elite once the pair is among the best ones. Primers already searched in the whole
+        genome use their whole-genome hits.
+        """
+        if not pairs:
+            return
+        start = time.perf_counter()
+        queries = {} # Primers without a known number of regional hits, {sequence: name}
+        genome_hits = {} # Whole-genome hits of the primers of these pairs, None if they were not searched
+        screened = 0
+        for pair in pairs:
+            for primer in self.primer_sequences(pair):
+                if primer in genome_hits:
+                    continue
+                genome_hits[primer] = self.hit_counts.get(primer)
+                if genome_hits[primer] is not None or primer in self.regional_counts:
+                    continue
+                screened += 1
+                if self.regional_index is not None:
+                    self.regional_counts[primer] = self.regional_index.count(primer)
+                else:
+                    queries[primer] = f"q{len(queries)}"
+
+        if queries:
+            try:
+                results = self.blast_search(queries, self.regional_db)
+            except RuntimeError as e:
+                raise RuntimeError(f"Specificity of the primers could not be checked with BLASTN in the region: {e}") from e
+            for primer, name in queries.items():
+                self.regional_counts[primer] = results.get(name, 0)
+        self.stats['regional_queries'] += screened
+
+        for pair in pairs:
+            pair.uni = 0
+            pair.confirmed = True
+            for primer in self.primer_sequences(pair):
+                hits = genome_hits[primer]
+                if hits is None:
+                    hits = self.regional_counts[primer]
+                    pair.confirmed = False
+                if hits != 1:
+                    pair.uni += 1
+            pair.FITNESS_counting()
+        self.stats['blast_time'] += time.perf_counter() - start
+
+    def blast_search(self, queries, blast_db):
+        """Run BLASTN against a given database for each primer and return the number of hits of each primer.
+
+        Primers are streamed to blastn over stdin and the hits are counted while blastn
+        is still writing them to stdout, so no temporary files are needed.
+        Raises RuntimeError with the error message of blastn if the search failed.
+        """
+        command = [
+            'blastn',
+            '-db', blast_db,
+            '-outfmt', '6 qseqid', # Only the name of the primer is needed to count its hits
+            '-perc_identity', '90',
+            '-qcov_hsp_perc', '90',
+            '-num_threads', '4',
+            '-task', 'blastn-short'
+        ]
+        try:
+            with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  text=True) as process:
+                # Primers are written and errors are read from separate threads, so that no full pipe can block blastn
+                writer = threading.Thread(target=self.write_queries, args=(queries, process.stdin))
+                errors = []
+                reader = threading.Thread(target=lambda: errors.append(process.stderr.read()))
+                writer.start()
+                reader.start()
+                counts = self.count_alignments(process.stdout)
+                writer.join()
+                reader.join()
+        except OSError as e: # E.g. blastn is not installed
+            raise RuntimeError(f"BLASTN could not be run: {e}") from e
+        if process.returncode != 0:
+            message = errors[0].strip() if errors and errors[0].strip() else "no error message"
+            raise RuntimeError(f"BLASTN search failed with exit status {process.returncode}: {message}")
+        return counts
+
+    def count_alignments(self, blast_output):
+        """Analyze BLASTN results for each primer, given the lines of the tabular output."""
+        counts = {}
+        for line in blast_output:
+            if line.strip():
+                primer_name = line.split()[0]
+                if primer_name in counts:
+                    counts[primer_name] += 1
+                else:
+                    counts[primer_name] = 1
+        return counts
+
+    def write_counts_to_file(self, counts, output_file):
+        """Write the number of matches for each primer in BLASTN analysis."""
+        with open(output_file, 'w') as file:
+            for primer, count in counts.items():
+                file.write(f"{primer}\t{count}\n")
+
+    def write_queries(self, queries, stream):
+        """Write primer sequences in FASTA format to a stream and close it, named by the given {sequence: name} dictionary."""
+        try:
+            try:
+                for primer, name in queries.items():
+                    stream.write(f">{name}\n{primer}\n")
+            finally:
+                stream.close()
+        except BrokenPipeError: # blastn exited early, its exit status and error message are reported by blast_search
+            pass
+
+    def exhaustive_search(self, top=10, batch_size=500):
+        """Return the top pairs of feasible primers, found exactly by branch and bound instead of the GA.
+
+        Primers are grouped by their length and their GC, Term and Sc penalties. These fix the
+        fitness of all pairs of a forward and a reverse group apart from Tmd, PC and uni, so the
+        pairs of two groups, split by Tmd, share the same fitness bound. Groups are enumerated
+        from the highest bound until no remaining pair can beat the top ones, and pairs are checked
+        with BLAST in batches, only if they could still enter the top.
+        """
+        table = self.primer_table
+        forward_groups = {} # {(alpha, GC, Term, Sc): [(fs, alpha)]}
+        for fs, alpha in table.feasible_forward:
+            primer = table.forward[(fs, alpha)]
+            key = (alpha, int(not primer.gc_ok), primer.term, int(primer.self_complementary()))
+            forward_groups.setdefault(key, []).append((fs, alpha))
+        reverse_groups = {} # {(gamma, GC, Term, Sc): [(tm, rs, gamma)]} sorted by melting temperature
+        for rs, gamma in table.feasible_reverse:
+            primer = table.reverse[(rs, gamma)]
+            key = (gamma, int(not primer.gc_ok), primer.term, int(primer.self_complementary()))
+            reverse_groups.setdefault(key, []).append((primer.tm, rs, gamma))
+        for group in reverse_groups.values():
+            group.sort()
+
+        branches = [] # (fitness bound, forward group, reverse group, Tmd)
+        for forward_key in forward_groups:
+            alpha, forward_gc, forward_term, forward_sc = forward_key
+            for reverse_key in reverse_groups:
+                gamma, reverse_gc, reverse_term, reverse_sc = reverse_key
+                bound = PrimerPair(0, alpha, 0, gamma)
+                bound.leng = 0 # The table only holds primers of allowed lengths
+                bound.lengd = self.length_difference(alpha, gamma)
+                bound.GC = forward_gc | reverse_gc
+                bound.Term = forward_term + reverse_term
+                bound.Sc = forward_sc | reverse_sc
+                bound.PC = 0
+                for Tmd in (0, 1):
+                    bound.Tmd = Tmd
+                    branches.append((bound.fitness_bound(), forward_key, reverse_key, Tmd))
+        branches.sort(key=lambda branch: branch[0], reverse=True)
+
+        best = [] # Min-heap of (fitness, order, pair) of the top pairs found so far
+        order = 0
+        scored = 0
+        candidates = []
+        for bound, forward_key, reverse_key, Tmd in branches:
+            if len(best) >= top and bound <= best[0][0]:
+                break # No remaining pair can beat the top ones
+            for pair in self.branch_pairs(forward_groups[forward_key], reverse_groups[reverse_key], Tmd):
+                self.properties(pair)
+                scored += 1
+                if len(best) < top or pair.fitness_bound() > best[0][0]:
+                    candidates.append(pair)
+                if len(candidates) >= batch_size:
+                    order = self.add_best(best, candidates, top, order)
+                    candidates = []
+                    if len(best) >= top and bound <= best[0][0]:
+                        break
+            order = self.add_best(best, candidates, top, order)
+            candidates = []
+        if self.verbose:
+            print(f"Exhaustive search: {scored} pairs scored, {self.stats['blast_queries']} primers searched with BLAST")
+        return [pair for fitness, order, pair in sorted(best, key=lambda item: (-item[0], item[1]))]
+
+    def branch_pairs(self, forward_keys, reverse_rows, Tmd):
+        """Yield the pairs of the given forward primers and reverse primers sorted by melting temperature with the given Tmd."""
+        tms = [row[0] for row in reverse_rows]
+        table = self.primer_table
+        for fs, alpha in forward_keys:
+            FTM = table.forward[(fs, alpha)].tm
+            # Reverse primers which may be within 5 degrees, checked exactly by temperatures_match
+            low = bisect.bisect_left(tms, FTM - 5.001)
+            high = bisect.bisect_right(tms, FTM + 5.001)
+            if Tmd == 0:
+                rows = reverse_rows[low:high]
+            else:
+                rows = reverse_rows[:low] + reverse_rows[high:] + reverse_rows[low:high]
+            for RTM, rs, gamma in rows:
+                if rs >= fs + alpha and self.temperatures_match(FTM, RTM) == (Tmd == 0):
+                    yield PrimerPair(fs, alpha, rs - (fs + alpha), gamma)
+
+    def add_best(self, best, candidates, top, order):
+        """Check the specificity of the candidates which can still enter the top pairs and add them to the min-heap best."""
+        if len(best) >= top:
+            candidates = [pair for pair in candidates if pair.fitness_bound() > best[0][0]]
+        self.check_specificity(candidates)
+        for pair in candidates:
+            if len(best) < top:
+                heapq.heappush(best, (pair.fitness, order, pair))
+            elif pair.fitness > best[0][0]:
+                heapq.heapreplace(best, (pair.fitness, order, pair))
+            order += 1
+        return order
 # Genetic Algorithm class
 class PrimerDesignGA:
-    def __init__(self, dna_sequence, beg_true, end_true, population_size, mating_pool, Pe, Pm, max_gen):
+    def __init__(self, dna_sequence, beg_true, end_true, population_size, mating_pool, Pe, Pm, max_gen,
+                 log_file=None, log_format='csv', log_flush=10,
+                 checkpoint_file=None, checkpoint_every=10, resume=None, max_attempts=None, adaptive=False,
+                 output_dir='.', hit_counts=None, primer_table=None, verbose=True, profiler=None,
+                 local_search_every=0, local_search_top=5, kmer_table=None, kmer_threshold=1000,
+                 blast_db="human_genome_db", regional_index=None, regional_db=None, elite_size=20,
+                 results_file=None, results_top=10, results_format='tsv', seed=None, rng=None):
         self.dna_sequence = dna_sequence  # Sequence in which the pair of primers should be found
         self.beg_true = beg_true  # Start of the target sequence
         self.end_true = end_true  # End of the target sequence
@@ -51,43 +906,244 @@ class PrimerDesignGA:
         self.mating_pool = mating_pool  # Number of pairs of primers creating a new population
         self.Pe = Pe  # Crossover likelihood
         self.Pm = Pm  # Mutation likelihood
+        self.start_Pe, self.start_Pm = Pe, Pm # Pe and Pm given to the run, before any adaptation
+        self.adaptive = adaptive # Adjust Pe and Pm every generation from the success of crossover and mutation
+        self.min_rate = 0.05 # Lowest Pe and Pm in adaptive mode, so that no operator is switched off
+        self.adaptation_speed = 0.3 # Part of the distance to the new rate covered in one generation
+        if adaptive: # An operator starting at 0 would make no offspring, so its success and rate would never change
+            self.Pe, self.Pm = max(Pe, self.min_rate), max(Pm, self.min_rate)
         self.max_gen = max_gen  # Maximal number of generations
-        self.maxtemp = 70 # Maximal melting temperature
-        self.mintemp = 50 # Minimal melting temperature
+        self.local_search_every = local_search_every # Refine the best pairs by local search every K generations, 0 turns it off
+        self.local_search_top = local_search_top # Number of the best pairs refined by local search
+        self.local_search_steps = 3 # Maximal number of moves of one pair in one local search
+        self.local_search_deltas = (-3, -2, -1, 1, 2, 3) # Changes of fs, alpha, beta and gamma tried by local search
+        self.output_dir = output_dir # Directory of the initial population, run logs and checkpoints
+        self.verbose = verbose # Print the best fitness of every generation
+        self.profiler = profiler # RunProfiler told about generation boundaries, None if the run is not profiled
+        # Maximal number of breeding iterations per generation, so that a generation always ends
+        self.max_attempts = max_attempts if max_attempts is not None else 10 * max(mating_pool, population_size)
+        self.stats = self.new_stats() # Counters and phase timings of the current generation
+        # Random numbers of this GA only, so that runs in parallel give the same results as serial ones.
+        # A RandomStream spawned by the caller, e.g. for one job of many, is used instead of a stream of the seed
+        self.rng = rng if rng is not None else RandomStream(seed)
+        self.generation = 0 # Number of the current generation
+        self.new_gen = [] # New generation of primers
+        # Primer table, BLAST hit counts and specificity settings used to score the pairs
+        self.scorer = PrimerScorer(dna_sequence, beg_true, end_true, hit_counts=hit_counts, primer_table=primer_table,
+                                   kmer_table=kmer_table, kmer_threshold=kmer_threshold, blast_db=blast_db,
+                                   regional_index=regional_index, regional_db=regional_db, verbose=verbose)
+        self.primer_table = self.scorer.primer_table
+        self.elite_size = elite_size # Number of the best pairs which always have whole-genome uni in tiered mode
+        self.population_file = os.path.join(output_dir, "initial_population.txt")
+        self.checkpoint_every = checkpoint_every # Save a checkpoint every N generations, 0 turns checkpoints off
+        if checkpoint_file is None:
+            checkpoint_file = os.path.join(output_dir, f"checkpoint_Pm_{Pm}_Pe_{Pe}.pkl")
+        self.checkpoint_file = checkpoint_file
+        if log_file is None:
+            log_file = os.path.join(output_dir, f"run_log_Pm_{Pm}_Pe_{Pe}.{log_format}")
+        compat_file = os.path.join(output_dir, f"fitness_Pm_{Pm}_Pe_{Pe}.txt")
+        if results_file is None:
+            results_file = os.path.join(output_dir, f"results_Pm_{Pm}_Pe_{Pe}.{results_format}")
+        # Best pairs of the run written while it is in progress, None if results_top is 0
+        self.top_pairs = TopPairs(results_file, results_top, results_format) if results_top else None
+        self.metadata_file = os.path.join(output_dir, f"run_Pm_{Pm}_Pe_{Pe}.json")
 
-        if os.path.exists("initial_population.txt"):
-            self.population = self.read_population_from_file("initial_population.txt") # Population of primers
+        if resume is not None:
+            offsets = self.load_checkpoint(resume)
+            self.write_metadata()
+            self.run_log = RunLog(log_file, log_format, log_flush, compat_file=compat_file, offsets=offsets)
+            self.GA()
+            return
+
+        self.write_metadata()
+        self.run_log = RunLog(log_file, log_format, log_flush, compat_file=compat_file)
+
+        start = time.perf_counter()
+        if os.path.exists(self.population_file):
+            self.population = self.read_population_from_file(self.population_file) # Population of primers
         else:
             self.population = self.initialize_population()
+        self.stats['new_offspring'] = len(self.population)
+        self.stats['breed_time'] = time.perf_counter() - start
         self.specifity(0)
+        start = time.perf_counter()
         self.population.sort(key=lambda pair: pair.fitness, reverse=True)
-        self.new_gen = [] # New generation of primers
+        self.stats['sort_time'] = time.perf_counter() - start
+        self.confirm_elite(self.population)
         self.GA()
 
+    def save_checkpoint(self):
+        """Save the whole GA state, so that the run can be resumed without scoring the population again."""
+        state = {
+            'sequence_length': len(self.dna_sequence),
+            'generation': self.generation,
+            'Pe': self.Pe,
+            'Pm': self.Pm,
+            'population': [vars(pair) for pair in self.population],
+            'stats': self.stats,
+            'scorer_stats': self.scorer.stats,
+            'seed': self.rng.seed_value,
+            'stream': self.rng.key,
+            'spawned': self.rng.spawned,
+            'random_state': self.rng.getstate(),
+            'hit_counts': self.scorer.hit_counts,
+            'regional_counts': self.scorer.regional_counts,
+            'log_offsets': self.run_log.offsets(),
+            'top_pairs': self.top_pairs.rows if self.top_pairs is not None else None,
+        }
+        # Write to a temporary file first, so that a crash while saving keeps the previous checkpoint
+        temp_file = self.checkpoint_file + ".tmp"
+        with open(temp_file, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.checkpoint_file)
+
+    def load_checkpoint(self, filename):
+        """Restore the GA state saved by save_checkpoint and return the saved sizes of the log files."""
+        with open(filename, 'rb') as file:
+            state = pickle.load(file)
+        if state['sequence_length'] != len(self.dna_sequence):
+            raise ValueError(f"Checkpoint {filename} was saved for a different DNA sequence")
+        self.generation = state['generation']
+        self.Pe = state['Pe']
+        self.Pm = state['Pm']
+        self.population = []
+        for attributes in state['population']:
+            pair = PrimerPair.__new__(PrimerPair)
+            pair.__dict__.update(attributes)
+            self.population.append(pair)
+        self.stats = state['stats']
+        self.scorer.stats = state['scorer_stats']
+        self.rng = RandomStream(state['seed'], state['stream'])
+        self.rng.spawned = state['spawned']
+        self.rng.setstate(state['random_state'])
+        self.scorer.hit_counts = state['hit_counts']
+        self.scorer.regional_counts = state['regional_counts']
+        if self.top_pairs is not None and state.get('top_pairs'):
+            self.top_pairs.rows = state['top_pairs']
+        return state['log_offsets']
+
+    def write_metadata(self):
+        """Write the seed and the parameters of the run, which are enough to repeat it."""
+        metadata = {'seed': self.rng.seed_value, 'stream': list(self.rng.key), 'spawned': self.rng.spawned,
+                    'sequence_length': len(self.dna_sequence),
+                    'beg_true': self.beg_true, 'end_true': self.end_true, 'population_size': self.population_size,
+                    'mating_pool': self.mating_pool, 'Pe': self.start_Pe, 'Pm': self.start_Pm, 'max_gen': self.max_gen,
+                    'adaptive': self.adaptive, 'max_attempts': self.max_attempts,
+                    'local_search_every': self.local_search_every, 'local_search_top': self.local_search_top,
+                    'blast_db': self.scorer.blast_db, 'tiered': self.scorer.tiered, 'elite_size': self.elite_size}
+        with open(self.metadata_file, 'w') as file:
+            json.dump(metadata, file, indent=2)
+
+    @staticmethod
+    def new_stats():
+        """Return zeroed counters and timings for one generation, apart from the ones of the scorer."""
+        return {'new_offspring': 0, 'attempts': 0, 'rejected': 0, 'pruned': 0,
+                'Pe': None, 'Pm': None, 'crossover_success': None, 'mutation_success': None, 'refined': 0,
+                'confirmed': 0, 'breed_time': 0.0, 'sort_time': 0.0}
+
+    def diversity(self):
+        """Fraction of distinct primer sequences among all primers of the population."""
+        if not self.population:
+            return 0
+        primers = set()
+        for pair in self.population:
+            primers.add(self.dna_sequence[pair.fs:pair.fe])
+            primers.add(self.dna_sequence[pair.rs:pair.re])
+        return len(primers) / (2 * len(self.population))
+
+    def log_generation(self, generation, compat=True):
+        """Record the current population and the counters of the step that produced it."""
+        fitness = [pair.fitness for pair in self.population]
+        row = {'generation': generation,
+               'best_fitness': self.population[0].fitness,
+               'mean_fitness': statistics.mean(fitness),
+               'median_fitness': statistics.median(fitness),
+               'diversity': self.diversity()}
+        row.update(self.stats)
+        row.update(self.scorer.stats)
+        produced = self.stats['new_offspring'] + self.stats['rejected']
+        row['rejection_rate'] = self.stats['rejected'] / produced if produced else 0
+        self.run_log.record(row, compat)
+        self.stats = self.new_stats()
+        self.scorer.stats = self.scorer.new_stats()
+
     def gather_input_info(self):
         """Gather user input for minimal and maximal melting temperature of primers."""
-        self.mintemp = int(input("Please input the minimum melting temperature: "))
-        self.maxtemp = int(input("Please input the maximum melting temperature: "))
+        self.scorer.mintemp = int(input("Please input the minimum melting temperature: "))
+        self.scorer.maxtemp = int(input("Please input the maximum melting temperature: "))
 
     def initialize_population(self):
         """Create a new initial population if the file doesn't exist."""
         population = []
-        with open("initial_population.txt", "w") as file:
-            while len(population) < self.population_size:
-                fs = random.randint(0, self.beg_true) 
-                alpha = random.randint(min_primer_length, max_primer_length)
-                gamma = random.randint(min_primer_length, max_primer_length)
-                if (len(self.dna_sequence) - gamma - (fs + alpha)) < self.end_true - (fs + alpha): 
-                    print('ERROR: Invalid primer pair generated')
-                else:
-                    beta = random.randint(self.end_true - (fs + alpha), len(self.dna_sequence) - gamma - (fs + alpha))
-                    primer_pair = PrimerPair(fs, alpha, beta, gamma)
-                    if not self.primer_pair_exists(population, primer_pair):
-                        self.properties(primer_pair)
-                        population.append(primer_pair)
-                        file.write(f"{fs},{alpha},{beta},{gamma}\n")
+        attempts = 0
+        with open(self.population_file, "w") as file:
+            while len(population) < self.population_size and attempts < self.max_attempts:
+                attempts += 1
+                primer_pair = self.random_pair()
+                if primer_pair is None or self.primer_pair_exists(population, primer_pair):
+                    self.stats['rejected'] += 1
+                    continue
+                self.scorer.properties(primer_pair)
+                population.append(primer_pair)
+                file.write(f"{primer_pair.fs},{primer_pair.alpha},{primer_pair.beta},{primer_pair.gamma}\n")
+        self.stats['attempts'] += attempts
+        if len(population) < self.population_size:
+            print(f'WARNING: Only {len(population)} distinct primer pairs were found for the initial population')
         return population
 
+    def random_pair(self):
+        """Draw a primer pair from the feasible primers of the primer table.
+
+        The reverse primer is drawn among the ones starting after the forward primer,
+        None is returned only if there is no such primer of the drawn length.
+        """
+        table = self.primer_table
+        fs, alpha = self.rng.choice(table.feasible_forward)
+        gamma = self.rng.randint(min_primer_length, max_primer_length)
+        starts = table.reverse_starts.get(gamma, [])
+        first = bisect.bisect_left(starts, max(fs + alpha, self.end_true))
+        if first == len(starts):
+            return None
+        rs = starts[self.rng.randrange(first, len(starts))]
+        return PrimerPair(fs, alpha, rs - (fs + alpha), gamma)
+
+    @staticmethod
+    def nearest(starts, position, lowest):
+        """Return the value of the sorted list starts closest to position and not lower than lowest, or None."""
+        first = bisect.bisect_left(starts, lowest)
+        index = bisect.bisect_left(starts, position, first)
+        candidates = starts[max(first, index - 1):index + 1]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda start: abs(start - position))
+
+    def repair(self, pair):
+        """Move the primers of a pair to the nearest feasible positions, or return None if there are none."""
+        table = self.primer_table
+        fs = pair.fs
+        if (fs, pair.alpha) not in table.forward_set:
+            fs = self.nearest(table.forward_starts.get(pair.alpha, []), fs, 0)
+            if fs is None:
+                return None
+        fe = fs + pair.alpha
+        rs = fe + pair.beta
+        if (rs, pair.gamma) not in table.reverse_set:
+            rs = self.nearest(table.reverse_starts.get(pair.gamma, []), rs, max(fe, self.end_true))
+            if rs is None:
+                return None
+        if fs == pair.fs and rs == pair.rs:
+            return pair
+        return PrimerPair(fs, pair.alpha, rs - fe, pair.gamma)
+
+    def add_offspring(self, pair, origin):
+        """Add a new primer pair created by the given operator to the new generation unless it already exists."""
+        if pair is None or self.primer_pair_exists(self.population, pair) or self.primer_pair_exists(self.new_gen, pair):
+            self.stats['rejected'] += 1
+            return
+        pair.origin = origin
+        self.scorer.properties(pair)
+        self.new_gen.append(pair)
+
     def read_population_from_file(self, filename):
         """Load initial population from file."""
         population = []
@@ -95,7 +1151,7 @@ class PrimerDesignGA:
             for line in file:
                 fs, alpha, beta, gamma = map(int, line.strip().split(","))
                 primer_pair = PrimerPair(fs, alpha, beta, gamma)
-                self.properties(primer_pair)
+                self.scorer.properties(primer_pair)
                 population.append(primer_pair)
         return population
 
@@ -105,19 +1161,20 @@ class PrimerDesignGA:
                    p.beta == primer_pair.beta and p.gamma == primer_pair.gamma
                    for p in population)
 
-    def display_population(self):
-        """Display the current population of primer pairs."""
+    @staticmethod
+    def display_population(population):
+        """Display the given population of primer pairs."""
         print("Displaying the entire population of primer pairs:")
         print(f"{'Index':>5} | {'Fs':>5} | {'Fe':>5} | {'Rs':>5} | {'Re':>5} | "
               f"{'Vector (Fs, Alpha, Beta, Gamma)':>30} | {'Fitness':>10}")
         print("-" * 70)
-        for index, primer_pair in enumerate(self.population):
+        for index, primer_pair in enumerate(population):
             print(f"{index:5} | {primer_pair.fs:5} | {primer_pair.fe:5} | {primer_pair.rs:5} | {primer_pair.re:5} | "
                   f"({primer_pair.fs}, {primer_pair.alpha}, {primer_pair.beta}, {primer_pair.gamma}) | {primer_pair.fitness}")
 
     def crossover(self, parent1, parent2):
         """Create offspring from two parent Primer Pairs."""
-        R = random.randint(0, 15)
+        R = self.rng.randint(0, 15)
         binary_mask = f"{R:04b}"  # To string representing binary structure
 
         # Crossover - randomly mixing the features Fs, alpha, beta and gamma of parents
@@ -134,66 +1191,168 @@ class PrimerDesignGA:
         offspring1 = PrimerPair(new_fs1, new_alpha1, new_beta1, new_gamma1)
         offspring2 = PrimerPair(new_fs2, new_alpha2, new_beta2, new_gamma2)
 
-        # Check if they fit the constrains
-        if offspring1.fs + offspring1.alpha + offspring1.beta + offspring1.gamma <= len(self.dna_sequence):
-            if not self.primer_pair_exists(self.population, offspring1):
-                if not self.primer_pair_exists(self.new_gen, offspring1):
-                    self.properties(offspring1)
-                    self.new_gen.append(offspring1)
-
-        if offspring2.fs + offspring2.alpha + offspring2.beta + offspring2.gamma <= len(self.dna_sequence):
-            if not self.primer_pair_exists(self.population, offspring2):
-                if not self.primer_pair_exists(self.new_gen, offspring2):
-                    self.properties(offspring2)
-                    self.new_gen.append(offspring2)
+        # Children breaking the constraints are moved to the nearest feasible primers
+        self.add_offspring(self.repair(offspring1), 'crossover')
+        self.add_offspring(self.repair(offspring2), 'crossover')
 
     def mutate(self, individual):
         """Create offspring from one PrimerPair using mutation."""
-        component_to_mutate = random.randint(0, 3) # Chose a component to mutate
+        component_to_mutate = self.rng.randint(0, 3) # Chose a component to mutate
+        table = self.primer_table
+        fs, alpha, beta, gamma = individual.fs, individual.alpha, individual.beta, individual.gamma
 
+        # Only values giving feasible primers are drawn. Changing fs or alpha moves the reverse primer too
         if component_to_mutate == 0:
-            mutation_value = random.randint(0, self.beg_true)
-            mutated_individual = PrimerPair(mutation_value, individual.alpha, individual.beta, individual.gamma)
+            candidates = [new_fs for new_fs in table.forward_starts.get(alpha, [])
+                          if (new_fs + alpha + beta, gamma) in table.reverse_set]
         elif component_to_mutate == 1:
-            mutation_value = random.randint(min_primer_length, max_primer_length)
-            mutated_individual = PrimerPair(individual.fs, mutation_value, individual.beta, individual.gamma)
+            candidates = [new_alpha for new_alpha in range(min_primer_length, max_primer_length + 1)
+                          if (fs, new_alpha) in table.forward_set and (fs + new_alpha + beta, gamma) in table.reverse_set]
         elif component_to_mutate == 2:
-            mutation_value = random.randint(self.end_true - (individual.fs + individual.alpha),
-                                            len(self.dna_sequence) - individual.gamma - (individual.fs + individual.alpha))
-            mutated_individual = PrimerPair(individual.fs, individual.alpha, mutation_value, individual.gamma)
+            candidates = [rs - (fs + alpha) for rs in table.reverse_starts.get(gamma, []) if rs >= fs + alpha]
         else:
-            mutation_value = random.randint(min_primer_length, max_primer_length)
-            mutated_individual = PrimerPair(individual.fs, individual.alpha, individual.beta, mutation_value)
-        
-        #Check if the new primer fits the constraints
-        if mutated_individual.fs + mutated_individual.alpha + mutated_individual.beta + mutated_individual.gamma <= len(self.dna_sequence):
-            if not self.primer_pair_exists(self.population, mutated_individual):
-                if not self.primer_pair_exists(self.new_gen, mutated_individual):
-                    self.properties(mutated_individual)
-                    self.new_gen.append(mutated_individual)
+            candidates = [new_gamma for new_gamma in range(min_primer_length, max_primer_length + 1)
+                          if (individual.rs, new_gamma) in table.reverse_set]
+        if not candidates:
+            self.stats['rejected'] += 1
+            return
+        mutation_value = self.rng.choice(candidates)
+
+        if component_to_mutate == 0:
+            mutated_individual = PrimerPair(mutation_value, alpha, beta, gamma)
+        elif component_to_mutate == 1:
+            mutated_individual = PrimerPair(fs, mutation_value, beta, gamma)
+        elif component_to_mutate == 2:
+            mutated_individual = PrimerPair(fs, alpha, mutation_value, gamma)
+        else:
+            mutated_individual = PrimerPair(fs, alpha, beta, mutation_value)
+
+        self.add_offspring(mutated_individual, 'mutation')
 
     def combine_and_sort(self):
         """Sort primers of 'old' and 'new' population to create a population of primer pairs with the highest fitness scores."""
+        self.stats['new_offspring'] = len(self.new_gen)
+        offspring = list(self.new_gen)
+        self.prune_new_gen()
         self.specifity(1)
+        start = time.perf_counter()
         self.population.extend(self.new_gen)
         self.new_gen.clear()
         self.population.sort(key=lambda pair: pair.fitness, reverse=True)
-        return self.population[:min(self.population_size, len(self.population))]
+        self.stats['sort_time'] += time.perf_counter() - start
+        self.confirm_elite(self.population)
+        survivors = self.population[:min(self.population_size, len(self.population))]
+        self.operator_success(offspring, survivors)
+        return survivors
+
+    def operator_success(self, offspring, survivors):
+        """Record which part of the offspring of each operator survived and adapt Pe and Pm to it in adaptive mode.
+
+        The more successful operator is applied with probability 1 and the other one with
+        a probability proportional to its success rate. Rates move towards these values
+        by adaptation_speed every generation.
+        """
+        self.stats['Pe'] = self.Pe
+        self.stats['Pm'] = self.Pm
+        survivor_ids = {id(pair) for pair in survivors}
+        success = {}
+        for origin in ('crossover', 'mutation'):
+            created = [pair for pair in offspring if pair.origin == origin]
+            if created:
+                success[origin] = sum(id(pair) in survivor_ids for pair in created) / len(created)
+        self.stats['crossover_success'] = success.get('crossover')
+        self.stats['mutation_success'] = success.get('mutation')
+
+        if not self.adaptive or not success:
+            return
+        best = max(success.values())
+        for origin, rate_name in (('crossover', 'Pe'), ('mutation', 'Pm')):
+            if origin not in success: # The operator was not used, nothing is known about it
+                continue
+            target = max(self.min_rate, success[origin] / best) if best > 0 else 1
+            rate = getattr(self, rate_name)
+            setattr(self, rate_name, rate + self.adaptation_speed * (target - rate))
+
+    def prune_new_gen(self):
+        """Drop offspring that cannot enter the population even with a perfect BLAST result.
+
+        uni only lowers the fitness, so an offspring whose fitness with uni = 0 is not higher
+        than the fitness of the last survivor would be cut off by combine_and_sort anyway.
+        """
+        if len(self.population) < self.population_size:
+            return
+        threshold = self.population[self.population_size - 1].fitness
+        competitive = [pair for pair in self.new_gen if pair.fitness_bound() > threshold]
+        self.stats['pruned'] += len(self.new_gen) - len(competitive)
+        self.new_gen = competitive
 
     def new_generation(self):
         """Create new generation of primer pairs using mutation and crossover."""
-        while len(self.new_gen) < self.mating_pool:
-            if random.random() < self.Pe:
+        start = time.perf_counter()
+        attempts = 0
+        while len(self.new_gen) < self.mating_pool and attempts < self.max_attempts:
+            attempts += 1
+            if self.rng.random() < self.Pe:
                 pair1, pair2 = self.roulette()
                 if pair1 is not None and pair2 is not None:
                     self.crossover(pair1, pair2)
 
-            if random.random() < self.Pm:
-                rand_pair = self.population[random.randint(0, self.population_size - 1)]
+            if self.rng.random() < self.Pm:
+                rand_pair = self.population[self.rng.randint(0, len(self.population) - 1)]
                 self.mutate(rand_pair)
+        self.stats['attempts'] += attempts
+        self.stats['breed_time'] += time.perf_counter() - start
 
         self.population = self.combine_and_sort()
 
+    def neighbours(self, pair):
+        """Return the pairs differing from the given one by a few bases in one of fs, alpha, beta or gamma.
+
+        Only pairs made of feasible primers and not present in the population are returned.
+        """
+        table = self.primer_table
+        neighbours = []
+        for delta in self.local_search_deltas:
+            for fs, alpha, beta, gamma in ((pair.fs + delta, pair.alpha, pair.beta, pair.gamma),
+                                           (pair.fs, pair.alpha + delta, pair.beta, pair.gamma),
+                                           (pair.fs, pair.alpha, pair.beta + delta, pair.gamma),
+                                           (pair.fs, pair.alpha, pair.beta, pair.gamma + delta)):
+                rs = fs + alpha + beta
+                if (fs, alpha) in table.forward_set and (rs, gamma) in table.reverse_set and rs >= self.end_true:
+                    neighbour = PrimerPair(fs, alpha, beta, gamma)
+                    if not self.primer_pair_exists(self.population, neighbour):
+                        neighbours.append(neighbour)
+        return neighbours
+
+    def local_search(self):
+        """Refine the best pairs of the population by hill climbing through their neighbours.
+
+        Neighbours are scored from the primer table first, and only the ones which could
+        beat the current pair with a perfect BLAST result are checked with BLAST.
+        """
+        start = time.perf_counter()
+        for index in range(min(self.local_search_top, len(self.population))):
+            current = self.population[index]
+            for step in range(self.local_search_steps):
+                candidates = []
+                for neighbour in self.neighbours(current):
+                    self.scorer.properties(neighbour)
+                    if neighbour.fitness_bound() > current.fitness:
+                        candidates.append(neighbour)
+                if not candidates:
+                    break
+                self.scorer.check_specificity(candidates)
+                best = max(candidates, key=lambda pair: pair.fitness)
+                if best.fitness <= current.fitness:
+                    break
+                best.origin = 'local search'
+                current = best
+            if current is not self.population[index]:
+                self.population[index] = current
+                self.stats['refined'] += 1
+        self.population.sort(key=lambda pair: pair.fitness, reverse=True)
+        self.stats['breed_time'] += time.perf_counter() - start
+
     def roulette(self):
         """Select two primer pairs for crossover based on their fitness scores.
         
@@ -213,8 +1372,8 @@ class PrimerDesignGA:
         if len(self.population) >= 2:
             sum_of_fitness = sum(pair.fitness for pair in self.population)
             cumulative_score = 0
-            rand1 = random.random()
-            rand2 = random.random()
+            rand1 = self.rng.random()
+            rand2 = self.rng.random()
             done = 0
 
             if sum_of_fitness != 0:
@@ -234,255 +1393,84 @@ class PrimerDesignGA:
                         break
                 return pair_no1, pair_no2
             else:
-                return self.population[random.randint(0, self.population_size - 1)], self.population[random.randint(0, self.population_size - 1)]
+                return self.population[self.rng.randint(0, len(self.population) - 1)], self.population[self.rng.randint(0, len(self.population) - 1)]
         else:
             return None, None
 
     def GA(self):
         """Run the genetic algorithm for a specified number of generations."""
-        i = 0
-        while i < self.max_gen:
-            print(self.population[0].fitness)
-            file_name = f"fitness_Pm_{self.Pm}_Pe_{self.Pe}.txt"
-            with open(file_name, 'a') as file:
-                file.write(f"{self.population[0].fitness}\n")
-            self.new_generation()
-            i += 1
-
-    def properties(self, pair):
-        """Calculate properties of a primer pair to obtain its fitness score."""
-        seqF = str(self.dna_sequence[pair.fs:pair.fs + pair.alpha])
-        # Creating the complementary and reversed sequence of Reverse Primer. This way I receive it's sequence 5'-> 3'
-        preseqR = str(self.dna_sequence[pair.fs + pair.alpha + pair.beta:pair.fs + pair.alpha + pair.beta + pair.gamma])
-        seqR = str(self.complementary(preseqR))
-
-        # Counting the GC content which should be between 40 and 60%
-        if len(seqF) > 0 and len(seqR) > 0:
-            FGC = (seqF.count('G') + seqF.count('C')) / len(seqF)
-            RGC = (seqR.count('G') + seqR.count('C')) / len(seqR)
-            pair.GC = 0 if 0.4 <= FGC <= 0.6 and 0.4 <= RGC <= 0.6 else 1
-        else:
-            pair.GC = 1
-
-        
-        # Counting the melting temperature difference beatween primers in pair
-        # On the basis of https://www.rosalind.bio/en/knowledge/what-formula-is-used-to-calculate-tm 
-        # It should be less than 5 Celsius degrees and be between the minimal and maximal temperature specified in the code by user (default: 50, 70)f len(seqF) <= 13:
-        if len(seqF) <= 13:    
-            FTM = (seqF.count('G') + seqF.count('C')) * 4 + (seqF.count('A') + seqF.count('T')) * 2
-        else:
-            FTM = 64.9 + 41 * (seqF.count('G') + seqF.count('C') - 16.4) / len(seqF)
-
-        if len(seqR) <= 13:
-            RTM = (seqR.count('G') + seqR.count('C')) * 4 + (seqR.count('A') + seqR.count('T')) * 2
-        else:
-            RTM = 64.9 + 41 * (seqR.count('G') + seqR.count('C') - 16.4) / len(seqR)
-
-        pair.Tmd = 0 if abs(FTM - RTM) <= 5 and self.mintemp <= FTM <= self.maxtemp and self.mintemp <= RTM <= self.maxtemp else 1
-        
-        # Checking the termination which should ba a G or a C for both primers. It can consist of two Gs or Cs but not more
-        if len(seqF) >= 1:
-            if seqF[-1] in ['G', 'C']:
-                if len(seqF) >= 2:
-                    if seqF[-2] in ['G', 'C']:
-                        if len(seqF) >= 3:
-                            if seqF[-3] not in ['G', 'C']:
-                                pair.Term = 0
-                            else:
-                                pair.Term = 1
-                    else:
-                        pair.Term = 0
-            else:
-                pair.Term = 1
-        else:
-            pair.Term = 1
-
-        if len(seqR) >= 1:
-            if seqR[-1] in ['G', 'C']:
-                if len(seqR) >= 2:
-                    if seqR[-2] in ['G', 'C']:
-                        if len(seqR) >= 3:
-                            if seqR[-3] in ['G', 'C']:
-                                pair.Term += 1
-            else:
-                pair.Term += 1
-        else:
-            pair.Term += 1
-
-        # Counting the length difference betaween primers in pair, it is a scale, but cannot be more than 5nn different
-        if abs(len(seqF) - len(seqR)) == 5:
-            pair.lengd = 0.75
-        elif 3 <= abs(len(seqF) - len(seqR)) < 5:
-            pair.lengd = 0.5
-        elif 0 < abs(len(seqF) - len(seqR)) < 3:
-            pair.lengd = 0.25
-        elif abs(len(seqF) - len(seqR)) == 0:
-            pair.lengd = 0
-        else:
-            pair.lengd = 1
-        # Analyzing the length of primers. They should be between minimal and maximal primer length, default(18,30)
-        pair.leng = 0 if min_primer_length <= len(seqF) <= max_primer_length and min_primer_length <= len(seqR) <= max_primer_length else 1
-
-        # Checking the self-complementarity
-        # Hairpins
-        min_loop_size = 3
-        min_stem_size = 4
-        pair.Sc = 0
+        try:
+            while self.generation < self.max_gen:
+                if self.profiler is not None:
+                    self.profiler.generation(self.generation)
+                if self.checkpoint_every and self.generation % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+                if self.verbose:
+                    print(self.population[0].fitness)
+                if self.top_pairs is not None:
+                    self.top_pairs.update(self.scorer, self.population, self.generation)
+                self.log_generation(self.generation)
+                self.new_generation()
+                if self.local_search_every and (self.generation + 1) % self.local_search_every == 0:
+                    self.local_search()
+                self.generation += 1
+            if self.scorer.tiered: # Every reported pair has whole-genome uni
+                self.confirm_elite(self.population, len(self.population))
+            if self.top_pairs is not None:
+                self.top_pairs.update(self.scorer, self.population, self.generation)
+            self.log_generation(self.generation, compat=False) # The final population is not part of the old fitness files
+        finally: # Generations logged before an error, e.g. a BLAST failure, are kept
+            self.run_log.close()
 
-        if len(seqF) - 2 * min_stem_size - min_loop_size >= 0:
-            for i in range(len(seqF) - min_loop_size - 2 * min_stem_size + 1):
-                if self.complementarity_check(seqF[:min_stem_size + i], seqF[min_stem_size + i + min_loop_size:]):
-                    pair.Sc = 1
-                    break
-
-        if pair.Sc == 0:
-            if len(seqR) - 2 * min_stem_size - min_loop_size >= 0:
-                for i in range(len(seqR) - min_loop_size - 2 * min_stem_size + 1):
-                    if self.complementarity_check(seqR[:min_stem_size + i], seqR[min_stem_size + i + min_loop_size:]):
-                        pair.Sc = 1
-                        break
-                    
-        # Linear complementarity
-        if self.complementarity_check(seqF, seqF):
-            pair.Sc = 1
-        if self.complementarity_check(seqR, seqR):
-            pair.Sc = 1
-            
-        # Checking whether two primers hybrydize together. The minimal number of compatible nucleotides can be changed in function complementarity_check(how_manyTA, how_manyCG)
-        pair.PC = 1 if self.complementarity_check(seqF, seqR) else 0
+    # Kept for the scripts which call the sequence helpers through the class
+    complementary = staticmethod(complementary)
+    complementarity_check = staticmethod(complementarity_check)
 
     @staticmethod
-    def complementary(sequence):
-        """Return the complementary sequence."""
-        compl_sequence = ''
-        dic = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
-        for i in sequence:
-            compl_sequence += dic[i]
-        compl_sequence = compl_sequence[::-1]
-        return compl_sequence
-
-    def complementarity_check(self, seq1, seq2):
-        """Check if two sequences are complementary and would hybridize."""
-        
-        # Deciding how many TA pairs and how many CG pairs will result in a secondary structure
-        how_many_TA = 6
-        how_many_CG = 4
-        summary_how_many = (how_many_TA + how_many_CG) / 2
-        
-        # Artificial change for comparing sequences
-        seq2 = self.complementary(seq2)
-
-        if len(seq1) > len(seq2):
-            longer, shorter = seq1, seq2
-        else:
-            longer, shorter = seq2, seq1
-
-        for i in range(len(longer)):
-            counter_TA, counter_CG = 0, 0
-            for j in range(len(shorter)):
-                if i + j >= len(longer):
-                    break
-                if longer[i + j] == shorter[j] and longer[i + j] in ('A', 'T'):
-                    counter_TA += 1
-                elif longer[i + j] == shorter[j] and longer[i + j] in ('G', 'C'):
-                    counter_CG += 1
-            if len(longer) - i - 1 < min(how_many_TA, how_many_CG):
-                break
-            
-            # Normalization
-            counter_CG = counter_CG * how_many_TA / how_many_CG
-            counter_TA = counter_TA * how_many_CG / how_many_TA
-            if counter_CG + counter_TA >= summary_how_many:
-                return True
-        return False
-
-    def write_primers_to_fasta(self, sequence, primers, output_file):
-        """Extract primer sequences and write them to a FASTA file."""
+    def write_primers_to_fasta(sequence, primers, output_file):
+        """Extract primer sequences and write them 5' -> 3' to a FASTA file."""
         with open(output_file, 'w') as fasta:
             for idx, primer_pair in enumerate(primers):
                 fwd_primer = sequence[primer_pair.fs:primer_pair.fs + primer_pair.alpha]
                 rev_primer = sequence[primer_pair.fs + primer_pair.alpha + primer_pair.beta:primer_pair.fs + primer_pair.alpha + primer_pair.beta + primer_pair.gamma]
                 fasta.write(f">{idx}_f\n{fwd_primer}\n")
-                fasta.write(f">{idx}_r\n{rev_primer}\n")
-
-    def blast_search(self, fasta_file, blast_db, output_file):
-        """Run BLASTN against a given database for each primer in the fasta file."""
-        try:
-            command = [
-                'blastn',
-                '-query', fasta_file,
-                '-db', blast_db,
-                '-out', output_file,
-                '-outfmt', '6',
-                '-perc_identity', '90',
-                '-qcov_hsp_perc', '90',
-                '-num_threads', '4',
-                '-task', 'blastn-short'
-            ]
-            subprocess.run(command, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"BLASTN search failed: {e}")
-        except Exception as e:
-            print(f"An error occurred: {e}")
-
-    def count_alignments(self, blast_output_file):
-        """Analyze BLASTN results for each primer."""
-        counts = {}
-        with open(blast_output_file, 'r') as file:
-            for line in file:
-                if line.strip():
-                    parts = line.split()
-                    primer_name = parts[0]
-                    if primer_name in counts:
-                        counts[primer_name] += 1
-                    else:
-                        counts[primer_name] = 1
-        return counts
-
-    def write_counts_to_file(self, counts, output_file):
-        """Write the number of matches for each primer in BLASTN analysis."""
-        with open(output_file, 'w') as file:
-            for primer, count in counts.items():
-                file.write(f"{primer}\t{count}\n")
+                fasta.write(f">{idx}_r\n{complementary(rev_primer)}\n") # The reverse primer binds the other strand
 
     def specifity(self, which):
         """Check the specificity of the population or new generation."""
-        if which == 0: # Population
-            self.write_primers_to_fasta(self.dna_sequence, self.population, "primers_fasta.fasta")
-        else: # New generation
-            self.write_primers_to_fasta(self.dna_sequence, self.new_gen, "primers_fasta.fasta")
-        self.blast_search("primers_fasta.fasta", "human_genome_db", "primers_results.txt")
-        results = self.count_alignments("primers_results.txt")
-        #self.write_counts_to_file(results, "primers_counts.txt")
-        os.remove("primers_fasta.fasta")
-        os.remove("primers_results.txt")
-        #os.remove("primers_counts.txt")
-        results = list(results.values())
-        if which == 0:
-            for index, primer in enumerate(self.population):
-                if results[index] > 1 or results[index] == 0:
-                    primer.uni += 1
-                if results[index + 1] > 1 or results[index + 1] == 0:
-                    primer.uni += 1
-                primer.FITNESS_counting()
+        pairs = self.population if which == 0 else self.new_gen
+        if self.scorer.tiered:
+            self.scorer.check_regional_specificity(pairs)
         else:
-            for index, primer in enumerate(self.new_gen):
-                if results[index] > 1 or results[index] == 0:
-                    primer.uni += 1
-                if results[index + 1] > 1 or results[index + 1] == 0:
-                    primer.uni += 1
-                primer.FITNESS_counting()
-
-def run_blat(query):
+            self.scorer.check_specificity(pairs)
+
+    def confirm_elite(self, population, elite_size=None):
+        """Check the best pairs of a sorted population against the whole genome until they all have whole-genome uni.
+
+        Confirmed pairs can only lose fitness and drop out of the elite, so the next
+        pairs are checked until the elite is stable.
+        """
+        if not self.scorer.tiered:
+            return
+        elite_size = elite_size if elite_size is not None else self.elite_size
+        while True:
+            pending = [pair for pair in population[:elite_size] if not pair.confirmed]
+            if not pending:
+                return
+            self.scorer.check_specificity(pending)
+            self.stats['confirmed'] += len(pending)
+            population.sort(key=lambda pair: pair.fitness, reverse=True)
+
+def run_blat(query, output_file="blat_output.psl"):
     """Run BLAT and parse the best hit coordinates."""
-    blat_command = ["blat", "hg38.2bit", query, "blat_output.psl"]
+    blat_command = ["blat", "hg38.2bit", query, output_file]
     subprocess.run(blat_command, check=True)
     best_hit = None
-    with open("blat_output.psl", "r") as file:
+    with open(output_file, "r") as file:
         lines = file.readlines()
         if len(lines) > 5: # Skipping header lines in PSL file
             best_hit = lines[5].strip().split()
-    os.remove("blat_output.psl")
+    os.remove(output_file)
     t_starts = list(map(int, best_hit[20].strip(',').split(',')))
     q_sizes = list(map(int, best_hit[18].strip(',').split(',')))
     return best_hit[13], t_starts[0], t_starts[-1] + q_sizes[-1]
@@ -505,12 +1493,12 @@ def fasta_to_string(file_name):
         print("Failed to read file due to:", e)
         return None
 
-def extract_sequence(genome, chrom, start, end):
+def extract_sequence(genome, chrom, start, end, output_file="hg38_cut.fa"):
     """Extract sequence from a genome with 500 nucleotide flanks."""
     start = max(0, start - 500)
     end = end + 500
-    subprocess.run(["twoBitToFa", f"-seq={chrom}", f"-start={start}", f"-end={end}", "hg38.2bit", "hg38_cut.fa"], check=True)
-    extended_seq = fasta_to_string("hg38_cut.fa")
+    subprocess.run(["twoBitToFa", f"-seq={chrom}", f"-start={start}", f"-end={end}", "hg38.2bit", output_file], check=True)
+    extended_seq = fasta_to_string(output_file)
     return extended_seq
 
 def find_target_sequence(dna_sequence, target_sequence):
@@ -526,9 +1514,41 @@ def find_target_sequence(dna_sequence, target_sequence):
 def parse_args():
     """Parse command line arguments for GA parameters."""
     parser = argparse.ArgumentParser(description='Run Primer Design GA with specified Pe and Pm values.')
-    parser.add_argument('--Pe', type=float, required=True, help='Crossover probability (Pe)')
-    parser.add_argument('--Pm', type=float, required=True, help='Mutation probability (Pm)')
-    return parser.parse_args()
+    parser.add_argument('--Pe', type=float, default=None, help='Crossover probability (Pe)')
+    parser.add_argument('--Pm', type=float, default=None, help='Mutation probability (Pm)')
+    parser.add_argument('--exact', action='store_true', help='Find the best pairs exactly by branch and bound instead of the GA, for small regions')
+    parser.add_argument('--top', type=int, default=10, help='Number of the best pairs found with --exact')
+    parser.add_argument('--flank', type=int, default=1000, help='Length of the sequence on both sides of the target where primers are placed')
+    parser.add_argument('--log-file', default=None, help='Per-generation run log (default: run_log_Pm_<Pm>_Pe_<Pe>.<format>)')
+    parser.add_argument('--log-format', choices=['csv', 'jsonl'], default='csv', help='Format of the run log')
+    parser.add_argument('--log-flush', type=int, default=10, help='Write the run log every N generations')
+    parser.add_argument('--checkpoint-file', default=None, help='Checkpoint file (default: checkpoint_Pm_<Pm>_Pe_<Pe>.pkl)')
+    parser.add_argument('--checkpoint-every', type=int, default=10, help='Save a checkpoint every N generations (0 turns checkpoints off)')
+    parser.add_argument('--max-attempts', type=int, default=None, help='Maximal number of breeding iterations per generation')
+    parser.add_argument('--adaptive', action='store_true', help='Adapt Pe and Pm during the run, starting from the given values')
+    parser.add_argument('--profile', action='store_true', help='Profile the run, see RunProfiler for the output files')
+    parser.add_argument('--profile-memory', action='store_true', help='With --profile, also report allocation sites at every generation')
+    parser.add_argument('--local-search-every', type=int, default=0, help='Refine the best pairs by local search every K generations (0 turns it off)')
+    parser.add_argument('--local-search-top', type=int, default=5, help='Number of the best pairs refined by local search')
+    parser.add_argument('--kmer-table', default=None, help='K-mer table of the genome built with kmer_table.py, used to skip BLAST for primers with a too common 3\' end')
+    parser.add_argument('--kmer-threshold', type=int, default=1000, help='Primers whose 3\' k-mer occurs more often in the genome are not searched with BLAST')
+    parser.add_argument('--blast-db', default='human_genome_db', help='BLAST database of the genome')
+    regional = parser.add_mutually_exclusive_group()
+    regional.add_argument('--regional-fasta', default=None, help='Screen new pairs against this small region of the genome (a few Mb containing the DNA sequence) held in memory, only the best pairs are searched in the whole genome')
+    regional.add_argument('--regional-db', default=None, help='Screen new pairs against this BLAST database of a region of the genome containing the DNA sequence (e.g. the target\'s chromosome), only the best pairs are searched in the whole genome')
+    parser.add_argument('--elite-size', type=int, default=20, help='Number of the best pairs searched in the whole genome in tiered mode')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the random number generator (default: a random seed, recorded in run_Pm_<Pm>_Pe_<Pe>.json)')
+    parser.add_argument('--stream', type=int, nargs='+', default=None, help='Key of a child stream of the seed, e.g. one recorded by a server job, to repeat it')
+    parser.add_argument('--results-file', default=None, help='Best pairs of the run, updated while it runs (default: results_Pm_<Pm>_Pe_<Pe>.<format>)')
+    parser.add_argument('--results-format', choices=['tsv', 'fasta'], default='tsv', help='Format of the results file')
+    parser.add_argument('--results-top', type=int, default=10, help='Number of the best distinct pairs in the results file (0 turns it off)')
+    parser.add_argument('--resume', default=None, metavar='CHECKPOINT', help='Continue the run saved in the given checkpoint')
+    args = parser.parse_args()
+    if not args.exact and (args.Pe is None or args.Pm is None):
+        parser.error('--Pe and --Pm are required unless --exact is given')
+    if args.stream is not None and args.seed is None:
+        parser.error('--stream requires --seed')
+    return args
 
 
 min_primer_length = 18
@@ -547,16 +1567,72 @@ def main():
 
     extended_sequence = extended_sequence.upper()
 
+    profiler = None
+    if args.profile:
+        profiler = RunProfiler("profile_exact" if args.exact else f"profile_Pm_{args.Pm}_Pe_{args.Pe}", memory=args.profile_memory)
+        profiler.start()
+
+    try:
+        if args.exact:
+            run_exact(extended_sequence, args)
+        else:
+            run_ga(extended_sequence, args, profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+def run_ga(extended_sequence, args, profiler):
+    """Run the GA on the extracted sequence with the command line parameters."""
     ga = PrimerDesignGA(
         extended_sequence,
-        1000,
-        len(extended_sequence) - 1000,
+        args.flank,
+        len(extended_sequence) - args.flank,
         population_size=200,
         mating_pool=80,
         Pe=args.Pe,
         Pm=args.Pm,
-        max_gen=100
+        max_gen=100,
+        log_file=args.log_file,
+        log_format=args.log_format,
+        log_flush=args.log_flush,
+        checkpoint_file=args.checkpoint_file,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume,
+        max_attempts=args.max_attempts,
+        adaptive=args.adaptive,
+        profiler=profiler,
+        local_search_every=args.local_search_every,
+        local_search_top=args.local_search_top,
+        kmer_table=KmerTable(args.kmer_table) if args.kmer_table else None,
+        kmer_threshold=args.kmer_threshold,
+        blast_db=args.blast_db,
+        results_file=args.results_file,
+        results_format=args.results_format,
+        results_top=args.results_top,
+        seed=args.seed,
+        rng=RandomStream(args.seed, args.stream) if args.stream is not None else None,
+        regional_index=RegionIndex(fasta_to_string(args.regional_fasta)) if args.regional_fasta else None,
+        regional_db=args.regional_db,
+        elite_size=args.elite_size
+    )
+
+def run_exact(extended_sequence, args):
+    """Find and print the best primer pairs of the extracted sequence by branch and bound."""
+    scorer = PrimerScorer(
+        extended_sequence,
+        args.flank,
+        len(extended_sequence) - args.flank,
+        kmer_table=KmerTable(args.kmer_table) if args.kmer_table else None,
+        kmer_threshold=args.kmer_threshold,
+        blast_db=args.blast_db
     )
+    pairs = scorer.exhaustive_search(args.top)
+    PrimerDesignGA.display_population(pairs)
+    for pair in pairs:
+        print(pair)
+    if args.results_top: # The file holds the best results_top of the pairs found, like the one of a GA run
+        results = TopPairs(args.results_file or f"results_exact.{args.results_format}", args.results_top, args.results_format)
+        results.update(scorer, pairs, 0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,108 @@
+'''
+Tools for the k-mer table used by code.py --kmer-table to skip BLAST for primers whose 3' end is too common in the genome.
+
+Build the table of all 12-mers of the genome (4**12 counts, 64 MB). It is done once and takes a long time for hg38:
+    python3 kmer_table.py build hg38.fa hg38_k12.kmer --k 12
+Check which threshold can be used, by comparing the table with BLAST results for a set of primers
+(a FASTA file of primers written 5' -> 3', like the one of PrimerDesignGA.write_primers_to_fasta):
+    blastn -task blastn-short -db human_genome_db -query primers.fasta -outfmt "6 qseqid" -perc_identity 90 -qcov_hsp_perc 90 > hits.txt
+    python3 kmer_table.py validate hg38_k12.kmer primers.fasta hits.txt
+'''
+import argparse
+from array import array
+
+from code import KmerTable
+
+THRESHOLDS = [2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def build(genome, output, k):
+    """Count every k-mer of one strand of the genome and write the counts to the output file."""
+    counts = array('I', bytes(4 * 4 ** k))
+    mask = 4 ** k - 1
+    codes = KmerTable.CODES
+    index = 0
+    valid = 0 # Number of A, C, G and T bases read since the last other base
+    with open(genome, 'r') as file:
+        for line in file:
+            if line.startswith('>'):
+                print(f"Counting {line[1:].strip()}")
+                valid = 0
+                continue
+            for base in line.strip().upper():
+                code = codes.get(base)
+                if code is None:
+                    valid = 0
+                    continue
+                index = ((index << 2) | code) & mask
+                valid += 1
+                if valid >= k:
+                    counts[index] += 1
+    with open(output, 'wb') as file:
+        counts.tofile(file)
+
+
+def read_fasta(file_name):
+    """Return {name: sequence} of a FASTA file."""
+    sequences = {}
+    name = None
+    with open(file_name, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('>'):
+                name = line[1:].split()[0]
+                sequences[name] = ''
+            elif name is not None:
+                sequences[name] += line.upper()
+    return sequences
+
+
+def validate(table_file, fasta_file, blast_file):
+    """Print how many primers each threshold would skip and how many of them are unique according to BLAST."""
+    table = KmerTable(table_file)
+    primers = read_fasta(fasta_file)
+    hits = dict.fromkeys(primers, 0)
+    with open(blast_file, 'r') as file:
+        for line in file:
+            if line.strip():
+                name = line.split()[0]
+                hits[name] = hits.get(name, 0) + 1
+
+    seeds = {}
+    for name, primer in primers.items(): # Primers are written 5' -> 3', reverse ones too
+        seeds[name] = table.count(primer[-table.k:])
+
+    unique = sum(hits[name] == 1 for name in primers)
+    print(f"{len(primers)} primers, {unique} unique according to BLAST, k = {table.k}")
+    print(f"{'Threshold':>10} | {'Skipped':>8} | {'Not unique':>10} | {'Unique (wrongly skipped)':>25}")
+    print("-" * 62)
+    for threshold in THRESHOLDS:
+        skipped = [name for name in primers if seeds[name] > threshold]
+        wrong = sum(hits[name] == 1 for name in skipped)
+        print(f"{threshold:>10} | {len(skipped):>8} | {len(skipped) - wrong:>10} | {wrong:>25}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Build or validate the k-mer table of a genome.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='Count all k-mers of a genome FASTA file')
+    build_parser.add_argument('genome', help='Genome in FASTA format')
+    build_parser.add_argument('output', help='Output k-mer table')
+    build_parser.add_argument('--k', type=int, default=12, help='Length of the k-mers (the table has 4**k entries of 4 bytes)')
+    validate_parser = commands.add_parser('validate', help='Compare the k-mer table with BLAST results')
+    validate_parser.add_argument('table', help='K-mer table')
+    validate_parser.add_argument('fasta', help='Primers in FASTA format')
+    validate_parser.add_argument('blast', help='BLAST tabular output for the primers, the first column is the primer name')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'build':
+        build(args.genome, args.output, args.k)
+    else:
+        validate(args.table, args.fasta, args.blast)
+
+if __name__ == "__main__":
+    main()
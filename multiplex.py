@@ -0,0 +1,256 @@
+'''
+Multiplex primer panel design: one primer pair per target, with no cross-dimers between the pairs.
+Candidate pairs of every target are found with the exhaustive search of code.py (--exact), then one compatible
+candidate is selected per target. Every target is a FASTA file with the target and its flanks, like hg38_cut.fa.
+
+    python3 multiplex.py panel.tsv --targets target1.fa target2.fa target3.fa --flank 200 --candidates 20
+
+With --cache, the dimer matrix of all candidate primers is kept between runs, so that adding a target to a panel
+only checks the primers of the new target.
+'''
+import argparse
+import os
+import pickle
+
+from code import PrimerScorer, KmerTable, complementary, fasta_to_string
+
+
+class DimerMatrix:
+    """All-vs-all cross-dimer matrix of primers, with one row of bits per primer, updated incrementally.
+
+    Bit j of row i is set when primers i and j hybridize in either order according to
+    complementarity_check. The check is bit-parallel: every primer is kept as one
+    integer bit mask per base, so the matches at one offset are counted with an AND and a popcount
+    instead of a loop over the bases. Adding a primer checks it against the primers in the matrix only.
+
+    complementarity_check finds a dimer between almost any two primers, so with three_prime only
+    the matches of the last three_prime bases of a primer count, i.e. dimers which the 3' end of
+    one primer can be extended from.
+    """
+
+    def __init__(self, three_prime=None):
+        self.three_prime = three_prime # Number of 3' bases whose matches are counted, None counts all bases
+        self.index = {} # {sequence: row number}
+        self.sequences = [] # Sequence of every row, None for removed primers
+        self.masks = [] # (masks of the primer, masks of its complementary sequence) of every row
+        self.rows = [] # Dimer bits of every row
+        self.free = [] # Row numbers of removed primers, reused by add
+
+    @staticmethod
+    def base_masks(seq):
+        """Return the length of a sequence and the bit masks of the positions of A, T, G and C in it."""
+        masks = {'A': 0, 'T': 0, 'G': 0, 'C': 0}
+        for position, base in enumerate(seq):
+            masks[base] |= 1 << position
+        return len(seq), (masks['A'], masks['T'], masks['G'], masks['C'])
+
+    def primer_masks(self, seq):
+        """Return the base masks of a primer, of its 3' end only with three_prime, and of its complementary sequence."""
+        length, masks = self.base_masks(seq)
+        if self.three_prime is not None:
+            end = (1 << length) - (1 << max(0, length - self.three_prime))
+            masks = tuple(mask & end for mask in masks)
+        return (length, masks), self.base_masks(complementary(seq))
+
+    @staticmethod
+    def hybridize(first, second):
+        """Same as complementarity_check(seq1, seq2), given base_masks of seq1 and of complementary(seq2)."""
+        (length1, masks1), (length2, masks2) = first, second
+        if length1 > length2:
+            length, (la, lt, lg, lc), (sa, st, sg, sc) = length1, masks1, masks2
+        else:
+            length, (la, lt, lg, lc), (sa, st, sg, sc) = length2, masks2, masks1
+        for i in range(length - 4): # Offsets with at least 5 bases of the longer sequence left
+            ta = ((la >> i) & sa | (lt >> i) & st).bit_count()
+            cg = ((lg >> i) & sg | (lc >> i) & sc).bit_count()
+            if 9 * cg + 4 * ta >= 30: # 1.5 * CG + TA / 1.5 >= 5, the normalization of complementarity_check
+                return True
+        return False
+
+    def add(self, seq):
+        """Add a primer to the matrix, checking it against the other primers, and return its row number."""
+        if seq in self.index:
+            return self.index[seq]
+        masks = self.primer_masks(seq)
+        number = self.free.pop() if self.free else len(self.rows)
+        row = 0
+        for other, other_masks in enumerate(self.masks):
+            if self.sequences[other] is None or other == number:
+                continue
+            if self.hybridize(masks[0], other_masks[1]) or self.hybridize(other_masks[0], masks[1]):
+                row |= 1 << other
+                self.rows[other] |= 1 << number
+        if number == len(self.rows):
+            self.sequences.append(seq)
+            self.masks.append(masks)
+            self.rows.append(row)
+        else:
+            self.sequences[number], self.masks[number], self.rows[number] = seq, masks, row
+        self.index[seq] = number
+        return number
+
+    def remove(self, seq):
+        """Remove a primer from the matrix."""
+        number = self.index.pop(seq)
+        row = self.rows[number]
+        while row:
+            other = (row & -row).bit_length() - 1
+            self.rows[other] &= ~(1 << number)
+            row &= row - 1
+        self.sequences[number], self.rows[number] = None, 0
+        self.free.append(number)
+
+    def save(self, file_name):
+        """Write the primers and rows of the matrix to a file, through a temporary file like the GA checkpoints."""
+        state = {'three_prime': self.three_prime, 'sequences': self.sequences, 'rows': self.rows}
+        with open(file_name + ".tmp", 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file_name + ".tmp", file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        """Return the matrix saved by save."""
+        with open(file_name, 'rb') as file:
+            state = pickle.load(file)
+        matrix = cls(state['three_prime'])
+        matrix.sequences = state['sequences']
+        matrix.rows = state['rows']
+        for number, seq in enumerate(matrix.sequences):
+            if seq is None:
+                matrix.masks.append(None)
+                matrix.free.append(number)
+            else:
+                matrix.masks.append(matrix.primer_masks(seq))
+                matrix.index[seq] = number
+        return matrix
+
+
+class MultiplexDesigner:
+    """Select one primer pair per target so that no two selected pairs form cross-dimers."""
+
+    def __init__(self, matrix=None, max_steps=1000):
+        self.matrix = matrix if matrix is not None else DimerMatrix()
+        self.max_steps = max_steps # Maximal number of swaps tried when the greedy selection leaves targets without a pair
+        self.candidates = {} # {target: [(pair, forward, reverse, primer bits)]} sorted by fitness
+        self.selection = {} # {target: index of the selected candidate}
+
+    def add_candidate(self, target, pair, forward, reverse):
+        """Add a candidate pair of a target, given its primers written 5' -> 3'."""
+        bits = 1 << self.matrix.add(forward) | 1 << self.matrix.add(reverse)
+        candidates = self.candidates.setdefault(target, [])
+        candidates.append((pair, forward, reverse, bits))
+        candidates.sort(key=lambda candidate: candidate[0].fitness, reverse=True)
+        self.selection.pop(target, None)
+
+    def dimers(self, bits):
+        """Return the bits of the primers hybridizing with any primer of the given bits."""
+        result = 0
+        while bits:
+            result |= self.matrix.rows[(bits & -bits).bit_length() - 1]
+            bits &= bits - 1
+        return result
+
+    def selected_bits(self, without=None):
+        """Return the bits of the primers of the selected pairs, except the one of the given target."""
+        bits = 0
+        for target, index in self.selection.items():
+            if target != without:
+                bits |= self.candidates[target][index][3]
+        return bits
+
+    def conflicts(self, target, index):
+        """Return the targets whose selected pairs form dimers with a candidate of the given target."""
+        dimers = self.dimers(self.candidates[target][index][3])
+        return [other for other, selected in self.selection.items()
+                if other != target and dimers & self.candidates[other][selected][3]]
+
+    def swap(self, target, index):
+        """Select a candidate for a target and drop the selected pairs of the targets it conflicts with."""
+        dropped = self.conflicts(target, index)
+        for other in dropped:
+            del self.selection[other]
+        self.selection[target] = index
+        return dropped
+
+    def select(self):
+        """Select a pair for every target, the best compatible one first, and return the targets left without one.
+
+        Targets with the fewest candidates are placed first. A target with no compatible candidate
+        takes the candidate conflicting with the fewest selected pairs, which lose their selection
+        and are placed again, until every target has a pair or max_steps swaps were made.
+        """
+        pending = sorted((target for target in self.candidates if target not in self.selection),
+                         key=lambda target: len(self.candidates[target]))
+        best_selection = dict(self.selection)
+        steps = 0
+        while pending and steps < self.max_steps:
+            target = pending.pop(0)
+            dimers = self.dimers(self.selected_bits(without=target))
+            compatible = [index for index, candidate in enumerate(self.candidates[target]) if not dimers & candidate[3]]
+            if compatible:
+                self.selection[target] = compatible[0]
+            else:
+                steps += 1
+                index = min(range(len(self.candidates[target])), key=lambda index: len(self.conflicts(target, index)))
+                pending.extend(self.swap(target, index))
+            if len(self.selection) > len(best_selection):
+                best_selection = dict(self.selection)
+        if pending:
+            self.selection = best_selection
+        return [target for target in self.candidates if target not in self.selection]
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Design a multiplex panel of compatible primer pairs.')
+    parser.add_argument('output', help='Output TSV file with the selected pair of every target')
+    parser.add_argument('--targets', nargs='+', required=True, help='FASTA files with the targets and their flanks')
+    parser.add_argument('--flank', type=int, default=1000, help='Length of the flanks where primers are placed')
+    parser.add_argument('--candidates', type=int, default=20, help='Number of candidate pairs of every target')
+    parser.add_argument('--cache', default=None, help='File keeping the dimer matrix between runs')
+    parser.add_argument('--three-prime', type=int, default=5, help='Count only dimers formed by this many 3\' bases of a primer (0 counts whole primers)')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Maximal number of swaps of the selection')
+    parser.add_argument('--kmer-table', default=None, help='K-mer table used to skip BLAST for primers with a too common 3\' end')
+    parser.add_argument('--kmer-threshold', type=int, default=1000, help='Maximal number of occurrences of the 3\' k-mer searched with BLAST')
+    parser.add_argument('--blast-db', default='human_genome_db', help='BLAST database of the genome')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    three_prime = args.three_prime or None
+    matrix = DimerMatrix.load(args.cache) if args.cache and os.path.exists(args.cache) else None
+    if matrix is not None and matrix.three_prime != three_prime:
+        print(f"WARNING: {args.cache} was built with another --three-prime, it is built again")
+        matrix = None
+    designer = MultiplexDesigner(matrix if matrix is not None else DimerMatrix(three_prime), args.max_steps)
+    kmer_table = KmerTable(args.kmer_table) if args.kmer_table else None
+    hit_counts = {} # Shared by the targets
+    for target in args.targets:
+        sequence = fasta_to_string(target).upper()
+        scorer = PrimerScorer(sequence, args.flank, len(sequence) - args.flank,
+                              hit_counts=hit_counts, kmer_table=kmer_table, kmer_threshold=args.kmer_threshold,
+                              blast_db=args.blast_db)
+        for pair in scorer.exhaustive_search(args.candidates):
+            forward, reverse = scorer.primer_sequences(pair)
+            designer.add_candidate(target, pair, forward, complementary(reverse))
+    if args.cache:
+        designer.matrix.save(args.cache)
+
+    designer.select()
+    missing = [target for target in args.targets if target not in designer.selection] # Also the targets without candidates
+    with open(args.output, 'w') as file:
+        file.write("target\tfs\talpha\tbeta\tgamma\tforward\treverse\tfitness\n")
+        for target in args.targets:
+            if target in designer.selection:
+                pair, forward, reverse, bits = designer.candidates[target][designer.selection[target]]
+                file.write(f"{target}\t{pair.fs}\t{pair.alpha}\t{pair.beta}\t{pair.gamma}\t{forward}\t{reverse}\t{pair.fitness}\n")
+    print(f"{len(designer.selection)} of {len(args.targets)} targets have a compatible pair")
+    for target in missing:
+        if designer.candidates.get(target):
+            print(f"WARNING: No pair of {target} is compatible with the rest of the panel")
+        else:
+            print(f"WARNING: No candidate pair was found for {target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+'''
+Score existing primer pairs without running the genetic algorithm.
+Pairs are read from a file, one per line, either as coordinates in the region sequence (like initial_population.txt):
+    fs,alpha,beta,gamma
+or as primer sequences written 5' -> 3':
+    FORWARD,REVERSE
+Empty lines and lines starting with # are skipped. Results are written as CSV with the fields printed by PrimerPair.
+
+Usage:
+    python3 score.py pairs.txt scores.csv --sequence hg38_cut.fa
+'''
+import argparse
+import csv
+import time
+
+from code import PrimerPair, PrimerScorer, PrimerTable, KmerTable, complementary, fasta_to_string
+
+
+class BulkScorer:
+    """Score primer pairs in batches, with the primer table and BLAST cache of one PrimerScorer."""
+
+    def __init__(self, dna_sequence, flank=1000, batch_size=500, hit_counts=None, kmer_table=None, kmer_threshold=1000):
+        self.batch_size = batch_size # Number of pairs checked with one BLAST search
+        self.scorer = PrimerScorer(dna_sequence, flank, len(dna_sequence) - flank,
+                                   hit_counts=hit_counts, kmer_table=kmer_table, kmer_threshold=kmer_threshold)
+
+    def parse(self, line):
+        """Return the primer pair described by one line of the input file."""
+        fields = [field.strip() for field in line.split(',')]
+        sequence = self.scorer.dna_sequence
+        if len(fields) == 4:
+            fs, alpha, beta, gamma = map(int, fields)
+        elif len(fields) == 2:
+            forward, reverse = fields[0].upper(), fields[1].upper()
+            for primer in (forward, reverse): # complementary() only knows A, C, G and T
+                if not PrimerTable.is_dna(primer):
+                    raise ValueError(f"primer {primer} has other bases than A, C, G and T")
+            fs = sequence.find(forward)
+            if fs == -1:
+                raise ValueError(f"forward primer {forward} not found in the sequence")
+            alpha, gamma = len(forward), len(reverse)
+            rs = sequence.find(complementary(reverse), fs + alpha)
+            if rs == -1:
+                raise ValueError(f"reverse primer {reverse} not found after the forward primer")
+            beta = rs - (fs + alpha)
+        else:
+            raise ValueError("expected fs,alpha,beta,gamma or FORWARD,REVERSE")
+        pair = PrimerPair(fs, alpha, beta, gamma)
+        if fs < 0 or min(alpha, beta, gamma) < 0 or pair.re > len(sequence):
+            raise ValueError("the pair does not fit in the sequence")
+        for primer in (sequence[pair.fs:pair.fe], sequence[pair.rs:pair.re]):
+            if not PrimerTable.is_dna(primer):
+                raise ValueError(f"primer {primer} has other bases than A, C, G and T")
+        return pair
+
+    def score(self, lines):
+        """Score the pairs of the given lines, yielding (line number, pair) in input order."""
+        batch = []
+        for number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                pair = self.parse(line)
+            except ValueError as e:
+                print(f"Line {number} skipped: {e}")
+                continue
+            self.scorer.properties(pair)
+            batch.append((number, pair))
+            if len(batch) >= self.batch_size:
+                yield from self.finish(batch)
+                batch = []
+        yield from self.finish(batch)
+
+    def finish(self, batch):
+        """Check the specificity of a batch of pairs and return it."""
+        self.scorer.check_specificity([pair for number, pair in batch])
+        return batch
+
+    def score_file(self, input_file, output_file):
+        """Score all pairs of the input file, write them to the output CSV file and return their number."""
+        count = 0
+        with open(input_file, 'r') as lines, open(output_file, 'w', newline='') as output:
+            writer = None
+            for number, pair in self.score(lines):
+                forward, reverse = self.scorer.primer_sequences(pair)
+                row = {'line': number}
+                row.update(pair.as_dict())
+                row.update({'fitness': pair.fitness, 'forward': forward, 'reverse': complementary(reverse)})
+                if writer is None:
+                    writer = csv.DictWriter(output, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                count += 1
+        return count
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Score primer pairs without running the GA.')
+    parser.add_argument('input', help='Primer pairs, one per line: fs,alpha,beta,gamma or FORWARD,REVERSE')
+    parser.add_argument('output', help='Output CSV file')
+    parser.add_argument('--sequence', default='hg38_cut.fa', help='FASTA file with the region of the primers')
+    parser.add_argument('--flank', type=int, default=1000, help='Length of the flanks where primers are placed')
+    parser.add_argument('--batch-size', type=int, default=500, help='Number of pairs checked with one BLAST search')
+    parser.add_argument('--kmer-table', default=None, help='K-mer table used to skip BLAST for primers with a too common 3\' end')
+    parser.add_argument('--kmer-threshold', type=int, default=1000, help='Maximal number of occurrences of the 3\' k-mer searched with BLAST')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sequence = fasta_to_string(args.sequence).upper()
+    scorer = BulkScorer(sequence, args.flank, args.batch_size,
+                        kmer_table=KmerTable(args.kmer_table) if args.kmer_table else None,
+                        kmer_threshold=args.kmer_threshold)
+    start = time.perf_counter()
+    count = scorer.score_file(args.input, args.output)
+    seconds = time.perf_counter() - start
+    print(f"Scored {count} pairs in {seconds:.1f} s ({count / seconds if seconds else 0:.0f} pairs per second)")
+
+if __name__ == "__main__":
+    main()
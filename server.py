@@ -0,0 +1,305 @@
+'''
+Local primer design server.
+Keeps the extracted target regions, the candidate primer tables and the BLAST hit counts in memory,
+so that every submitted design does not start from scratch. Designs run on a bounded pool of workers.
+
+Start the server:
+    python3 server.py --port 8000 --workers 2
+Submit a design (either "sequence" - the region to design primers in, or "target" - a sequence located in hg38 with BLAT):
+    curl -X POST localhost:8000/jobs -d '{"sequence": "ACGT...", "Pe": 0.5, "Pm": 0.5, "max_gen": 100, "seed": 1}'
+A job without a seed gets its own child stream of the random stream of the server (see --seed), in the order of submission.
+Its seed and stream are reported, and the job is repeated by submitting both, or with code.py --seed <seed> --stream <stream>.
+Check its status and results:
+    curl localhost:8000/jobs/<id>
+'''
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from code import PrimerDesignGA, RandomStream, complementary, run_blat, extract_sequence
+
+# Parameters of a job and their default values, the same as in code.py
+JOB_DEFAULTS = {
+    'flank': 1000, # Length of the sequence on both sides of the target where primers are placed
+    'population_size': 200,
+    'mating_pool': 80,
+    'Pe': 0.5,
+    'Pm': 0.5,
+    'max_gen': 100,
+    'adaptive': False,
+    'top': 10, # Number of the best primer pairs returned
+    'seed': None, # Seed of the random number generator, a child stream of the server's one if it is not given
+    'stream': None, # Key of a child stream of the seed, given to repeat a job which was given no seed
+}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LRUCache(OrderedDict):
+    """Dictionary keeping only its max_size most recently used entries, shared by the worker threads."""
+
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self.lock:
+            if super().__contains__(key):
+                self.move_to_end(key) # A checked entry is read soon after, it must not be evicted before
+                return True
+            return False
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_size:
+                self.popitem(last=False)
+
+
+def parse_bool(value):
+    """Return a JSON boolean, also given as "true" or "false", or raise ValueError."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise ValueError(f'Expected true or false, got {value!r}')
+
+
+class DesignService:
+    """Queue of primer design jobs with caches shared between the jobs."""
+
+    def __init__(self, workers, max_queue, work_dir, max_tables=32, max_jobs=1000, max_regions=100, max_hit_counts=1000000,
+                 seed=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_queue = max_queue # Maximal number of jobs waiting for a worker
+        self.work_dir = work_dir # Every job writes its logs to its own subdirectory
+        self.max_tables = max_tables # Number of primer tables kept in memory
+        self.max_jobs = max_jobs # Number of finished jobs kept for status requests
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict() # {job id: job}
+        self.hit_counts = LRUCache(max_hit_counts) # BLAST hits of the recently used primers, shared by all jobs
+        self.regions = LRUCache(max_regions) # {target: extended sequence} of targets recently located with BLAT
+        self.tables = OrderedDict() # {(sequence, beg_true, end_true): PrimerTable}, least recently used first
+        self.rng = RandomStream(seed) # Root stream spawning the streams of the jobs submitted without a seed
+
+    def submit(self, params):
+        """Validate the parameters of a new job and queue it."""
+        if not isinstance(params, dict) or ('sequence' in params) == ('target' in params):
+            raise ValueError('Exactly one of "sequence" and "target" has to be given')
+        job_params = dict(JOB_DEFAULTS)
+        for name, value in params.items():
+            if name not in ('sequence', 'target') and name not in JOB_DEFAULTS:
+                raise ValueError(f'Unknown parameter: {name}')
+            try:
+                job_params[name] = self.parse_param(name, value)
+            except (TypeError, ValueError) as e: # E.g. null, a list or an object where a number is expected
+                raise ValueError(f'Invalid value of "{name}": {value!r}') from e
+        if job_params['stream'] is not None and job_params['seed'] is None:
+            raise ValueError('"stream" requires "seed"')
+
+        with self.lock:
+            queued = sum(job['status'] == 'queued' for job in self.jobs.values())
+            if queued >= self.max_queue:
+                raise QueueFull()
+            if job_params['seed'] is None: # Spawned while the lock is held, so streams follow the order of submission
+                rng = self.rng.spawn()[0]
+            else:
+                rng = RandomStream(job_params['seed'], job_params['stream'] or ())
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'submitted': time.time(),
+                                 'started': None, 'finished': None, 'error': None,
+                                 'seed': rng.seed_value, 'stream': list(rng.key), 'pairs': None}
+            self.forget_old_jobs()
+        self.executor.submit(self.run, job_id, job_params, rng)
+        return self.status(job_id)
+
+    @staticmethod
+    def parse_param(name, value):
+        """Return a job parameter converted to the type of its default value, or raise TypeError or ValueError."""
+        if name in ('sequence', 'target'):
+            return str(value).upper()
+        if name == 'seed':
+            return int(value) if value is not None else None
+        if name == 'stream':
+            if value is None:
+                return None
+            if not isinstance(value, list):
+                raise TypeError('"stream" must be a list of numbers')
+            return [int(number) for number in value]
+        if isinstance(JOB_DEFAULTS[name], bool):
+            return parse_bool(value)
+        return type(JOB_DEFAULTS[name])(value)
+
+    def forget_old_jobs(self):
+        """Drop the oldest finished jobs above max_jobs, with the directories of their logs."""
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+            shutil.rmtree(os.path.join(self.work_dir, job_id), ignore_errors=True)
+
+    def status(self, job_id=None):
+        """Return a copy of one job, or of all jobs without their results."""
+        with self.lock:
+            if job_id is None:
+                return [{key: value for key, value in job.items() if key != 'pairs'} for job in self.jobs.values()]
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **changes):
+        with self.lock:
+            self.jobs[job_id].update(changes)
+
+    def region(self, params, job_dir):
+        """Return the sequence to design primers in, locating and extracting the target only once."""
+        if 'sequence' in params:
+            return params['sequence']
+        target = params['target']
+        with self.lock:
+            sequence = self.regions.get(target)
+        if sequence is None:
+            query = os.path.join(job_dir, "target.fasta")
+            with open(query, 'w') as file:
+                file.write(f">target\n{target}\n")
+            chrom, start, end = run_blat(query, os.path.join(job_dir, "blat_output.psl"))
+            sequence = extract_sequence("hg38.fa", chrom, start, end, os.path.join(job_dir, "hg38_cut.fa")).upper()
+            with self.lock:
+                self.regions[target] = sequence
+        return sequence
+
+    def run(self, job_id, params, rng):
+        """Run one primer design job."""
+        self.update(job_id, status='running', started=time.time())
+        try:
+            job_dir = os.path.join(self.work_dir, job_id)
+            os.makedirs(job_dir, exist_ok=True)
+            sequence = self.region(params, job_dir)
+            beg_true, end_true = params['flank'], len(sequence) - params['flank']
+            key = (sequence, beg_true, end_true)
+            with self.lock:
+                table = self.tables.get(key)
+                if table is not None:
+                    self.tables.move_to_end(key)
+
+            ga = PrimerDesignGA(
+                sequence,
+                beg_true,
+                end_true,
+                population_size=params['population_size'],
+                mating_pool=params['mating_pool'],
+                Pe=params['Pe'],
+                Pm=params['Pm'],
+                max_gen=params['max_gen'],
+                checkpoint_every=0,
+                adaptive=params['adaptive'],
+                output_dir=job_dir,
+                hit_counts=self.hit_counts,
+                primer_table=table,
+                verbose=False,
+                rng=rng
+            )
+
+            with self.lock:
+                self.tables[key] = ga.primer_table
+                self.tables.move_to_end(key)
+                while len(self.tables) > self.max_tables:
+                    self.tables.popitem(last=False)
+
+            pairs = []
+            for pair in ga.population[:params['top']]:
+                forward, reverse = ga.scorer.primer_sequences(pair)
+                pairs.append({'fs': pair.fs, 'alpha': pair.alpha, 'beta': pair.beta, 'gamma': pair.gamma,
+                              'forward': forward, 'reverse': complementary(reverse), 'fitness': pair.fitness,
+                              'properties': str(pair)})
+            self.update(job_id, status='done', finished=time.time(), pairs=pairs)
+        except Exception as e:
+            self.update(job_id, status='failed', finished=time.time(), error=str(e))
+
+
+class DesignRequestHandler(BaseHTTPRequestHandler):
+    """HTTP interface of DesignService: POST /jobs, GET /jobs and GET /jobs/<id>."""
+    service = None
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = self.service.submit(json.loads(self.rfile.read(length) or b'{}'))
+        except QueueFull:
+            self.send_json(503, {'error': 'Too many queued jobs'})
+        except ValueError as e: # Includes invalid JSON
+            self.send_json(400, {'error': str(e)})
+        else:
+            self.send_json(202, job)
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            self.send_json(200, self.service.status())
+        elif len(parts) == 2 and parts[0] == 'jobs' and self.service.status(parts[1]) is not None:
+            self.send_json(200, self.service.status(parts[1]))
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+
+def parse_args():
+    """Parse command line arguments of the server."""
+    parser = argparse.ArgumentParser(description='Run a local primer design server.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=2, help='Number of designs run at the same time')
+    parser.add_argument('--max-queue', type=int, default=100, help='Maximal number of jobs waiting for a worker')
+    parser.add_argument('--work-dir', default='server_jobs', help='Directory for the logs of the jobs')
+    parser.add_argument('--max-regions', type=int, default=100, help='Number of targets located with BLAT kept in memory')
+    parser.add_argument('--max-hit-counts', type=int, default=1000000, help='Number of BLAST results of primers kept in memory')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the stream spawning the streams of jobs without a seed (default: a random seed)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    DesignRequestHandler.service = DesignService(args.workers, args.max_queue, args.work_dir,
+                                                 max_regions=args.max_regions, max_hit_counts=args.max_hit_counts,
+                                                 seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), DesignRequestHandler)
+    print(f"Primer design server listening on {args.host}:{args.port}, seed {DesignRequestHandler.service.rng.seed_value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        DesignRequestHandler.service.executor.shutdown(wait=False, cancel_futures=True)
+
+if __name__ == "__main__":
+    main()
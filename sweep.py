@@ -0,0 +1,243 @@
+'''
+Parameter sweep spread over many worker processes, on one or several hosts, through an SQLite job table.
+The database and the work directory should be on storage shared by all hosts.
+
+Create the jobs - every combination of Pe, Pm, seed and target (a FASTA file with the region, like hg38_cut.fa):
+    python3 sweep.py create sweep.db --pe 0.5 --pm 0.0 0.2 0.4 0.6 0.8 1.0 --seeds 1 2 3 --targets hg38_cut.fa
+Start any number of workers, each runs one job at a time until no job is left:
+    python3 sweep.py work sweep.db --work-dir sweep_runs --blast-db /shared/human_genome_db
+See the progress and results:
+    python3 sweep.py status sweep.db
+
+A running job updates its heartbeat every minute. A job whose heartbeat is older than --stale-after
+(e.g. its worker was killed) is claimed again by another worker, which resumes it from its last checkpoint.
+Failed jobs are tried again up to --max-attempts times.
+'''
+import argparse
+import csv
+import itertools
+import json
+import os
+import shlex
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code.py")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    Pe REAL NOT NULL,
+    Pm REAL NOT NULL,
+    seed INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, running, done or failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed REAL,
+    heartbeat REAL,
+    finished REAL,
+    seconds REAL,
+    best_fitness REAL,
+    error TEXT,
+    UNIQUE (Pe, Pm, seed, target)
+)
+'''
+
+
+def connect(database):
+    """Open the job database, waiting for locks held by other workers."""
+    connection = sqlite3.connect(database, timeout=60, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute(SCHEMA)
+    return connection
+
+
+def create(database, pe_values, pm_values, seeds, targets):
+    """Add a job for every combination of the parameters, skipping the ones already in the table."""
+    connection = connect(database)
+    jobs = [(Pe, Pm, seed, os.path.abspath(target))
+            for Pe, Pm, seed, target in itertools.product(pe_values, pm_values, seeds, targets)]
+    with connection:
+        connection.execute("BEGIN")
+        connection.executemany("INSERT OR IGNORE INTO jobs (Pe, Pm, seed, target) VALUES (?, ?, ?, ?)", jobs)
+    print(f"{len(jobs)} jobs in the sweep")
+
+
+def claim(connection, worker, stale_after, max_attempts):
+    """Atomically take a pending or stale job, or return None if there is none."""
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE") # Locks the database for writing, so that no other worker takes the same job
+    try:
+        # Stale jobs which used all their attempts are not taken again
+        connection.execute("UPDATE jobs SET status = 'failed' WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                           (now - stale_after, max_attempts))
+        job = connection.execute(
+            "SELECT * FROM jobs WHERE attempts < ? AND "
+            "(status = 'pending' OR (status = 'running' AND heartbeat < ?)) ORDER BY id LIMIT 1",
+            (max_attempts, now - stale_after)).fetchone()
+        if job is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, claimed = ?, heartbeat = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now, now, job['id']))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return job
+
+
+def run_log(job_dir, Pe, Pm, code_args):
+    """Return the run log file of a job and its format, as chosen in code_args."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--log-file', default=None)
+    parser.add_argument('--log-format', default='csv')
+    log_args, _ = parser.parse_known_args(code_args)
+    return os.path.join(job_dir, log_args.log_file or f"run_log_Pm_{Pm}_Pe_{Pe}.{log_args.log_format}"), log_args.log_format
+
+
+def best_fitness(job_dir, Pe, Pm, code_args):
+    """Return the best fitness of the last generation in the run log of a job."""
+    log_file, log_format = run_log(job_dir, Pe, Pm, code_args)
+    last = None
+    with open(log_file, 'r', newline='') as file:
+        if log_format == 'jsonl':
+            for line in file:
+                if line.strip():
+                    last = json.loads(line)
+        else:
+            for last in csv.DictReader(file):
+                pass
+    return float(last['best_fitness']) if last is not None else None
+
+
+def run_job(connection, job, work_dir, blast_db, code_args, max_attempts, heartbeat_every=60):
+    """Run one job of the sweep with code.py in its own directory and record the result."""
+    job_dir = os.path.abspath(os.path.join(work_dir, f"job_{job['id']}"))
+    os.makedirs(job_dir, exist_ok=True)
+    region = os.path.join(job_dir, "hg38_cut.fa")
+    if not os.path.lexists(region):
+        os.symlink(job['target'], region)
+    command = [sys.executable, CODE, f"--Pe={job['Pe']}", f"--Pm={job['Pm']}", f"--seed={job['seed']}",
+               f"--blast-db={blast_db}"] + code_args
+    checkpoint = f"checkpoint_Pm_{job['Pm']}_Pe_{job['Pe']}.pkl"
+    if os.path.exists(os.path.join(job_dir, checkpoint)): # An earlier attempt was interrupted
+        command.append(f"--resume={checkpoint}")
+    else:
+        # An attempt interrupted before its first checkpoint, e.g. during the BLAST search of the initial population,
+        # may have left its initial population and logs. The population would be read instead of drawn, so the run
+        # would not follow its seed, and the new fitness values would be appended to the old ones
+        stale = [run_log(job_dir, job['Pe'], job['Pm'], code_args)[0], "initial_population.txt",
+                 f"fitness_Pm_{job['Pm']}_Pe_{job['Pe']}.txt"]
+        for name in stale:
+            path = os.path.join(job_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    start = time.time()
+    with open(os.path.join(job_dir, "output.txt"), 'a') as output:
+        process = subprocess.Popen(command, cwd=job_dir, stdout=output, stderr=subprocess.STDOUT)
+        try:
+            while True:
+                try:
+                    process.wait(timeout=heartbeat_every)
+                    break
+                except subprocess.TimeoutExpired:
+                    try:
+                        connection.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job['id']))
+                    except sqlite3.OperationalError as e: # E.g. the database stayed locked, try again next time
+                        print(f"Heartbeat of job {job['id']} not recorded: {e}")
+        finally:
+            # The run must not outlive its worker, or it would write to job_dir together with the worker taking the job again
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    seconds = time.time() - start
+
+    if process.returncode == 0:
+        connection.execute(
+            "UPDATE jobs SET status = 'done', finished = ?, seconds = ?, best_fitness = ?, error = NULL WHERE id = ?",
+            (time.time(), seconds, best_fitness(job_dir, job['Pe'], job['Pm'], code_args), job['id']))
+    else:
+        fail(connection, job, max_attempts, seconds, f"code.py exited with status {process.returncode}, see {job_dir}/output.txt")
+    return process.returncode == 0
+
+
+def fail(connection, job, max_attempts, seconds, error):
+    """Record a failed attempt of a job. It is tried again by any worker until it runs out of attempts."""
+    connection.execute(
+        "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+        "finished = ?, seconds = ?, error = ? WHERE id = ?",
+        (max_attempts, time.time(), seconds, error, job['id']))
+
+
+def work(database, work_dir, blast_db, code_args, stale_after, max_attempts):
+    """Run jobs of the sweep until none is left."""
+    connection = connect(database)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        job = claim(connection, worker, stale_after, max_attempts)
+        if job is None:
+            break
+        print(f"{worker}: job {job['id']} (Pe={job['Pe']}, Pm={job['Pm']}, seed={job['seed']}, target={job['target']})")
+        try:
+            done = run_job(connection, job, work_dir, blast_db, code_args, max_attempts)
+        except (OSError, ValueError, sqlite3.Error) as e: # E.g. a missing run log, an unwritable work directory or a locked database
+            try:
+                fail(connection, job, max_attempts, None, str(e))
+            except sqlite3.Error: # The job is taken again by another worker once its heartbeat is stale
+                pass
+            done = False
+        if not done:
+            print(f"{worker}: job {job['id']} failed")
+
+
+def status(database):
+    """Print the jobs of the sweep."""
+    connection = connect(database)
+    print(f"{'Id':>4} | {'Pe':>5} | {'Pm':>5} | {'Seed':>5} | {'Status':>8} | {'Attempts':>8} | {'Seconds':>8} | "
+          f"{'Best fitness':>12} | Worker")
+    print("-" * 90)
+    for job in connection.execute("SELECT * FROM jobs ORDER BY id"):
+        seconds = f"{job['seconds']:.0f}" if job['seconds'] is not None else ''
+        fitness = f"{job['best_fitness']:.5f}" if job['best_fitness'] is not None else ''
+        print(f"{job['id']:>4} | {job['Pe']:>5} | {job['Pm']:>5} | {job['seed']:>5} | {job['status']:>8} | "
+              f"{job['attempts']:>8} | {seconds:>8} | {fitness:>12} | {job['worker'] or ''}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of the GA on several workers.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create_parser = commands.add_parser('create', help='Add the jobs of a sweep to the database')
+    create_parser.add_argument('database', help='SQLite job database')
+    create_parser.add_argument('--pe', type=float, nargs='+', required=True, help='Crossover probabilities')
+    create_parser.add_argument('--pm', type=float, nargs='+', required=True, help='Mutation probabilities')
+    create_parser.add_argument('--seeds', type=int, nargs='+', default=[1], help='Seeds of the random number generator')
+    create_parser.add_argument('--targets', nargs='+', default=['hg38_cut.fa'], help='FASTA files with the regions')
+    work_parser = commands.add_parser('work', help='Run jobs until none is left')
+    work_parser.add_argument('database', help='SQLite job database')
+    work_parser.add_argument('--work-dir', default='sweep_runs', help='Directory for the outputs of the jobs')
+    work_parser.add_argument('--blast-db', default=os.path.abspath('human_genome_db'), help='BLAST database of the genome')
+    work_parser.add_argument('--code-args', default='', help='Other options passed to code.py, e.g. "--adaptive"')
+    work_parser.add_argument('--stale-after', type=float, default=600, help='Seconds without a heartbeat after which a job is taken again')
+    work_parser.add_argument('--max-attempts', type=int, default=3, help='Maximal number of attempts of a job')
+    status_parser = commands.add_parser('status', help='Print the jobs')
+    status_parser.add_argument('database', help='SQLite job database')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'create':
+        create(args.database, args.pe, args.pm, args.seeds, args.targets)
+    elif args.command == 'work':
+        work(args.database, args.work_dir, args.blast_db, shlex.split(args.code_args), args.stale_after, args.max_attempts)
+    else:
+        status(args.database)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+# The scripts of the repository are imported as top-level modules, like they import each other
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code import PrimerScorer, complementary
+
+# Primers written 5' -> 3' with no penalty at all: GC, Tm, Term, Sc and PC are 0 and they have the same length
+FORWARD = 'TCCCTCCCTCAATCCTCTCG'
+REVERSE = 'CCTTCGCTCTCTATACCTCC'
+
+
+@pytest.fixture
+def flank():
+    """Number of bases on both sides of the target of perfect_sequence."""
+    return 30
+
+
+@pytest.fixture
+def perfect_sequence():
+    """Region with FORWARD at its start and REVERSE at its end, around a target of 40 bases."""
+    return FORWARD + 'A' * 10 + 'ACGT' * 10 + 'T' * 10 + complementary(REVERSE)
+
+
+@pytest.fixture
+def unique_blast(monkeypatch):
+    """Replace PrimerScorer.blast_search with a search reporting one hit for every primer."""
+    monkeypatch.setattr(PrimerScorer, 'blast_search', lambda self, queries, blast_db: {name: 1 for name in queries.values()})
+
+
+@pytest.fixture
+def stub_blastn(tmp_path, monkeypatch):
+    """Put a blastn reporting one hit for every primer first on the PATH, for code.py run as a process."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    blastn = bin_dir / "blastn"
+    blastn.write_text(f"#!{sys.executable}\n"
+                      "import sys\n"
+                      "for line in sys.stdin:\n"
+                      "    if line.startswith('>'):\n"
+                      "        print(line[1:].strip())\n")
+    blastn.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
@@ -0,0 +1,21 @@
+import csv
+
+from code import PrimerDesignGA
+
+
+def rates(tmp_path):
+    with open(tmp_path / "run_log_Pm_0.0_Pe_0.5.csv", newline='') as file:
+        return [(float(row['Pe']), float(row['Pm'])) for row in csv.DictReader(file) if row['Pe']]
+
+
+def test_adaptive_run_uses_an_operator_starting_at_zero(perfect_sequence, flank, unique_blast, tmp_path):
+    ga = PrimerDesignGA(perfect_sequence, flank, len(perfect_sequence) - flank, 10, 6, 0.5, 0.0, 5,
+                        output_dir=str(tmp_path), checkpoint_every=0, verbose=False, adaptive=True, seed=1)
+    assert all(Pm >= ga.min_rate for Pe, Pm in rates(tmp_path))
+    assert ga.start_Pm == 0.0 # The metadata keeps the rate given to the run
+
+
+def test_fixed_rates_are_not_changed(perfect_sequence, flank, unique_blast, tmp_path):
+    PrimerDesignGA(perfect_sequence, flank, len(perfect_sequence) - flank, 10, 6, 0.5, 0.0, 3,
+                   output_dir=str(tmp_path), checkpoint_every=0, verbose=False, seed=1)
+    assert set(rates(tmp_path)) == {(0.5, 0.0)}
@@ -0,0 +1,36 @@
+import pytest
+
+from code import PrimerPair, PrimerScorer
+
+
+@pytest.fixture
+def scorer_of(flank, unique_blast):
+    return lambda sequence: PrimerScorer(sequence, flank, len(sequence) - flank, verbose=False)
+
+
+def brute_force(scorer):
+    """Fitness of every pair of feasible primers, the highest first."""
+    table = scorer.primer_table
+    pairs = []
+    for fs, alpha in table.feasible_forward:
+        for rs, gamma in table.feasible_reverse:
+            if rs >= fs + alpha:
+                pairs.append(PrimerPair(fs, alpha, rs - (fs + alpha), gamma))
+    for pair in pairs:
+        scorer.properties(pair)
+    scorer.check_specificity(pairs)
+    return sorted((pair.fitness for pair in pairs), reverse=True)
+
+
+def test_pair_without_penalty_has_perfect_fitness(perfect_sequence, scorer_of):
+    scorer = scorer_of(perfect_sequence)
+    pair = PrimerPair(0, 20, len(perfect_sequence) - 40, 20)
+    scorer.properties(pair)
+    scorer.check_specificity([pair])
+    assert pair.fitness == pair.fitness_bound() == PrimerPair.PERFECT_FITNESS
+
+
+def test_exhaustive_search_with_perfect_pair_matches_brute_force(perfect_sequence, scorer_of):
+    best = scorer_of(perfect_sequence).exhaustive_search(top=5, batch_size=7)
+    assert best[0].fitness == PrimerPair.PERFECT_FITNESS
+    assert [pair.fitness for pair in best] == brute_force(scorer_of(perfect_sequence))[:5]
@@ -0,0 +1,14 @@
+from code import PrimerDesignGA, RunProfiler
+
+
+def test_memory_report_leaves_out_tracemalloc(perfect_sequence, flank, unique_blast, tmp_path):
+    profiler = RunProfiler(str(tmp_path / "profile"), memory=True)
+    profiler.start()
+    try:
+        PrimerDesignGA(perfect_sequence, flank, len(perfect_sequence) - flank, 10, 6, 0.5, 0.5, 3,
+                       output_dir=str(tmp_path), checkpoint_every=0, verbose=False, profiler=profiler, seed=1)
+    finally:
+        profiler.stop()
+    report = (tmp_path / "profile_memory.txt").read_text()
+    assert "Generation end" in report
+    assert "tracemalloc.py" not in report
@@ -0,0 +1,31 @@
+import csv
+import random
+
+from code import PrimerDesignGA, PrimerScorer
+
+
+def blast_search(self, queries, blast_db):
+    """Report one hit for most primers and two for the rest, so that uni differs between pairs."""
+    return {name: 1 if primer.count('A') % 3 else 2 for primer, name in queries.items()}
+
+
+def final_population(sequence, output_dir):
+    """Return the final population of a seeded run and the number of offspring pruned in it."""
+    output_dir.mkdir()
+    ga = PrimerDesignGA(sequence, 100, len(sequence) - 100, 30, 20, 0.5, 0.5, 15,
+                        output_dir=str(output_dir), checkpoint_every=0, verbose=False, seed=7)
+    with open(output_dir / "run_log_Pm_0.5_Pe_0.5.csv", newline='') as file:
+        pruned = sum(int(row['pruned']) for row in csv.DictReader(file) if row['pruned'])
+    return [(pair.fs, pair.alpha, pair.beta, pair.gamma, pair.fitness) for pair in ga.population], pruned
+
+
+def test_pruning_does_not_change_the_population(monkeypatch, tmp_path):
+    monkeypatch.setattr(PrimerScorer, 'blast_search', blast_search)
+    sequence = ''.join(random.Random(2).choice('ACGT') for _ in range(300))
+    pruned, count = final_population(sequence, tmp_path / "pruned")
+    assert count > 0
+
+    monkeypatch.setattr(PrimerDesignGA, 'prune_new_gen', lambda self: None)
+    unpruned, count = final_population(sequence, tmp_path / "unpruned")
+    assert count == 0
+    assert pruned == unpruned
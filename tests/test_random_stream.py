@@ -0,0 +1,62 @@
+import json
+import pickle
+import random
+
+from code import PrimerDesignGA, RandomStream
+from server import DesignService
+
+
+def draws(rng, count=5):
+    return [rng.random() for _ in range(count)]
+
+
+def test_root_stream_matches_random_seed():
+    assert draws(RandomStream(7)) == draws(random.Random(7))
+
+
+def test_spawned_streams_are_independent_and_repeatable():
+    root = RandomStream(7)
+    first, second = root.spawn(2)
+    third, = root.spawn()
+    assert (first.key, second.key, third.key) == ((0,), (1,), (2,))
+    assert root.spawned == 3
+    assert draws(second) == draws(RandomStream(7, (1,)))
+    assert draws(first.spawn()[0]) == draws(RandomStream(7, (0, 0)))
+    assert len({tuple(draws(stream)) for stream in RandomStream(7).spawn(3)} | {tuple(draws(RandomStream(7)))}) == 4
+
+
+def test_run_records_and_resumes_its_stream(perfect_sequence, flank, unique_blast, tmp_path):
+    stream = RandomStream(3).spawn(2)[1]
+    stream.spawn() # The spawn count is kept with the stream
+    ga = PrimerDesignGA(perfect_sequence, flank, len(perfect_sequence) - flank, 10, 6, 0.5, 0.5, 4,
+                        output_dir=str(tmp_path), checkpoint_every=2, verbose=False, rng=stream)
+    with open(tmp_path / "run_Pm_0.5_Pe_0.5.json") as file:
+        metadata = json.load(file)
+    assert (metadata['seed'], metadata['stream'], metadata['spawned']) == (3, [1], 1)
+    with open(ga.checkpoint_file, 'rb') as file:
+        state = pickle.load(file)
+    assert (state['seed'], state['stream'], state['spawned']) == (3, (1,), 1)
+
+    resumed = PrimerDesignGA(perfect_sequence, flank, len(perfect_sequence) - flank, 10, 6, 0.5, 0.5, 4,
+                             output_dir=str(tmp_path), checkpoint_every=0, verbose=False, resume=ga.checkpoint_file)
+    assert (resumed.rng.seed_value, resumed.rng.key, resumed.rng.spawned) == (3, (1,), 1)
+    assert [vars(pair) for pair in resumed.population] == [vars(pair) for pair in ga.population]
+
+
+def run_jobs(service, jobs):
+    submitted = [service.submit(job) for job in jobs]
+    service.executor.shutdown(wait=True)
+    return [service.status(job['id']) for job in submitted]
+
+
+def test_server_jobs_get_streams_of_the_server_seed(perfect_sequence, flank, unique_blast, tmp_path):
+    job = {'sequence': perfect_sequence, 'flank': flank, 'population_size': 10, 'mating_pool': 6, 'max_gen': 3}
+    first = run_jobs(DesignService(2, 10, str(tmp_path / "first"), seed=5), [job, job])
+    second = run_jobs(DesignService(2, 10, str(tmp_path / "second"), seed=5), [job, job])
+    assert [status['status'] for status in first] == ['done', 'done']
+    assert [(status['seed'], status['stream']) for status in first] == [(5, [0]), (5, [1])]
+    assert [status['pairs'] for status in first] == [status['pairs'] for status in second]
+
+    repeated, = run_jobs(DesignService(1, 10, str(tmp_path / "repeated")), [dict(job, seed=5, stream=[1])])
+    assert (repeated['seed'], repeated['stream']) == (5, [1])
+    assert repeated['pairs'] == first[1]['pairs']
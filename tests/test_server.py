@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from server import DesignRequestHandler, DesignService
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Address of a design server running in a thread."""
+    DesignRequestHandler.service = DesignService(1, 10, str(tmp_path / "jobs"))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), DesignRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    DesignRequestHandler.service.executor.shutdown(wait=True)
+
+
+def post(url, data):
+    request = urllib.request.Request(url + "/jobs", data=json.dumps(data).encode(), method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize('params', [{'Pe': None}, {'seed': 1, 'stream': 5}, {'top': [1]}, {'max_gen': {'a': 1}},
+                                    {'adaptive': 1}, {'Pm': 'high'}])
+def test_parameter_of_a_wrong_type_is_a_bad_request(server, params):
+    status, body = post(server, dict(params, sequence='ACGT'))
+    assert status == 400
+    assert list(params)[-1] in body['error']
+
+
+def test_forgotten_jobs_lose_their_directories(perfect_sequence, flank, unique_blast, tmp_path):
+    service = DesignService(1, 10, str(tmp_path / "jobs"), max_jobs=1)
+    job = {'sequence': perfect_sequence, 'flank': flank, 'population_size': 10, 'mating_pool': 6, 'max_gen': 2}
+    first = service.submit(job)
+    service.executor.submit(lambda: None).result() # Waits for the first job, the service has one worker
+    assert os.path.isdir(tmp_path / "jobs" / first['id'])
+    second = service.submit(job)
+    service.executor.shutdown(wait=True)
+    assert service.status(first['id']) is None
+    assert not os.path.exists(tmp_path / "jobs" / first['id'])
+    assert service.status(second['id'])['status'] == 'done'
@@ -0,0 +1,35 @@
+from code import PrimerPair, PrimerScorer
+
+
+def test_hits_are_mapped_back_to_pairs_by_sequence(perfect_sequence, flank):
+    scorer = PrimerScorer(perfect_sequence, flank, len(perfect_sequence) - flank, verbose=False)
+    pairs = [PrimerPair(0, 20, 60, 20), PrimerPair(0, 20, 55, 25), PrimerPair(1, 19, 60, 20)]
+    for pair in pairs:
+        scorer.properties(pair)
+    forward, reverse = scorer.primer_sequences(pairs[0])
+    other_reverse = scorer.primer_sequences(pairs[1])[1]
+    other_forward = scorer.primer_sequences(pairs[2])[0]
+    hits = {forward: 1, reverse: 1, other_reverse: 3} # other_forward has no hit, so it is missing in the output
+    searches = []
+
+    def blast_search(queries, blast_db):
+        searches.append(dict(queries))
+        return {name: hits[primer] for primer, name in queries.items() if primer in hits}
+
+    scorer.blast_search = blast_search
+    scorer.check_specificity(pairs)
+    assert len(searches) == 1
+    assert sorted(searches[0]) == sorted({forward, reverse, other_reverse, other_forward})
+    assert len(set(searches[0].values())) == 4 # Every primer is searched once, under its own name
+    assert [pair.uni for pair in pairs] == [0, 1, 1]
+    assert pairs[0].fitness == pairs[0].fitness_bound()
+
+    # Primers searched before are taken from the hit counts, in any order of the pairs
+    again = [PrimerPair(1, 19, 60, 20), PrimerPair(0, 20, 55, 25), PrimerPair(0, 20, 60, 20)]
+    for pair in again:
+        scorer.properties(pair)
+    scorer.check_specificity(again)
+    assert len(searches) == 1
+    assert [pair.uni for pair in again] == [1, 1, 0]
+    assert scorer.stats['blast_queries'] == 4
+    assert scorer.stats['cache_hits'] == 2 + 6
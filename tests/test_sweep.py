@@ -0,0 +1,83 @@
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import sweep
+
+
+def jobs_of(database):
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    return {job['id']: dict(job) for job in connection.execute("SELECT * FROM jobs")}
+
+
+def test_claim_takes_every_job_once(tmp_path):
+    database = str(tmp_path / "sweep.db")
+    sweep.create(database, [0.5], [0.2, 0.4], [1], ["target.fa"])
+    first, second = sweep.connect(database), sweep.connect(database)
+    claimed = [sweep.claim(first, 'a', 600, 3), sweep.claim(second, 'b', 600, 3)]
+    assert sorted(job['id'] for job in claimed) == [1, 2]
+    assert sweep.claim(first, 'a', 600, 3) is None
+    assert {job['status'] for job in jobs_of(database).values()} == {'running'}
+
+
+def test_stale_job_is_claimed_again_until_it_runs_out_of_attempts(tmp_path):
+    database = str(tmp_path / "sweep.db")
+    sweep.create(database, [0.5], [0.2], [1], ["target.fa"])
+    connection = sweep.connect(database)
+    for attempt in (1, 2):
+        job = sweep.claim(connection, f"worker{attempt}", 600, 2)
+        assert job['id'] == 1
+        assert sweep.claim(connection, 'other', 600, 2) is None # Its heartbeat is fresh
+        connection.execute("UPDATE jobs SET heartbeat = ? WHERE id = 1", (time.time() - 601,))
+    assert jobs_of(database)[1]['attempts'] == 2
+    assert sweep.claim(connection, 'other', 600, 2) is None
+    assert jobs_of(database)[1]['status'] == 'failed'
+
+
+def log_without_times(job_dir):
+    with open(os.path.join(job_dir, "run_log_Pm_0.2_Pe_0.5.csv"), newline='') as file:
+        return [{name: value for name, value in row.items() if not name.endswith('_time')} for row in csv.DictReader(file)]
+
+
+def test_job_interrupted_before_its_first_checkpoint_follows_its_seed(perfect_sequence, flank, stub_blastn, tmp_path):
+    target = tmp_path / "target.fa"
+    target.write_text(f">target\n{perfect_sequence}\n")
+    code_args = [f"--flank={flank}", "--results-top=0"]
+    database = str(tmp_path / "sweep.db")
+    sweep.create(database, [0.5], [0.2], [1], [str(target), str(target.with_name("copy.fa"))])
+    os.symlink(target, target.with_name("copy.fa"))
+    connection = sweep.connect(database)
+
+    clean = sweep.claim(connection, 'worker', 600, 3)
+    assert sweep.run_job(connection, clean, str(tmp_path / "runs"), "db", code_args, 3)
+
+    # The first attempt of the other job was killed after writing its initial population, without a checkpoint
+    retried = sweep.claim(connection, 'worker', 600, 3)
+    interrupted_dir = tmp_path / "runs" / f"job_{retried['id']}"
+    interrupted_dir.mkdir()
+    (interrupted_dir / "initial_population.txt").write_text("0,18,64,18\n")
+    (interrupted_dir / "fitness_Pm_0.2_Pe_0.5.txt").write_text("0.5\n")
+    assert sweep.run_job(connection, retried, str(tmp_path / "runs"), "db", code_args, 3)
+
+    clean_dir = tmp_path / "runs" / f"job_{clean['id']}"
+    assert log_without_times(interrupted_dir) == log_without_times(clean_dir)
+    assert (interrupted_dir / "fitness_Pm_0.2_Pe_0.5.txt").read_text() == (clean_dir / "fitness_Pm_0.2_Pe_0.5.txt").read_text()
+    assert {job['status'] for job in jobs_of(database).values()} == {'done'}
+
+
+def test_two_local_workers_finish_the_sweep(perfect_sequence, flank, stub_blastn, tmp_path):
+    target = tmp_path / "target.fa"
+    target.write_text(f">target\n{perfect_sequence}\n")
+    database = str(tmp_path / "sweep.db")
+    sweep.create(database, [0.5], [0.2, 0.4], [1], [str(target)])
+    command = [sys.executable, sweep.__file__, 'work', database, '--work-dir', str(tmp_path / "runs"),
+               '--blast-db', 'db', '--code-args', f"--flank={flank} --results-top=0"]
+    workers = [subprocess.Popen(command, stdout=subprocess.DEVNULL) for _ in range(2)]
+    assert [worker.wait(timeout=300) for worker in workers] == [0, 0]
+    jobs = jobs_of(database).values()
+    assert [job['status'] for job in jobs] == ['done', 'done']
+    assert all(job['attempts'] == 1 for job in jobs)